@@ -1,40 +1,67 @@
 #!/usr/bin/env python3
 """
-Alert Scheduler - Runs daily checks for payment alerts and notifications
+Alert Scheduler - Runs the cron jobs in the Job table (alert checks, scheduled reports,
+cleanup) and delivers notifications. Safe to run on several nodes: only the node holding
+the scheduler lease runs jobs, while email delivery and import recovery claim their own work.
 """
 
 import schedule
 import time
 from datetime import datetime
 from app import app
+from import_service import import_service
+from notification_outbox import notification_outbox
+from job_scheduler import job_scheduler
 from alert_service import alert_service
+from models import db
 
-def run_daily_alerts():
-    """Run daily alert checks within Flask app context"""
+def resume_import_jobs():
+    """Pick up import jobs left pending or stalled by a crashed or redeployed worker"""
     with app.app_context():
         try:
-            print(f"[{datetime.now()}] Starting daily alert checks...")
-            alert_service.run_daily_checks()
-            print(f"[{datetime.now()}] Daily alert checks completed successfully")
+            resumed = import_service.resume_jobs(app)
+            if resumed:
+                print(f"[{datetime.now()}] Resumed {len(resumed)} import jobs")
         except Exception as e:
-            print(f"[{datetime.now()}] Error running daily alert checks: {str(e)}")
+            print(f"[{datetime.now()}] Error resuming import jobs: {str(e)}")
+
+def deliver_notifications():
+    """Drain the email outbox over a single SMTP connection"""
+    with app.app_context():
+        try:
+            stats = notification_outbox.deliver_pending()
+            if any(stats.values()):
+                print(f"[{datetime.now()}] Email outbox: {stats['sent']} sent, {stats['retrying']} retrying, {stats['failed']} failed")
+        except Exception as e:
+            print(f"[{datetime.now()}] Error delivering notifications: {str(e)}")
 
 def main():
     """Main scheduler function"""
-    print("Alert Scheduler started...")
+    print(f"Alert Scheduler started as node {job_scheduler.node_id}...")
+    
+    # Count alerts that predate the badge counters (e.g. on first deploy); later changes are counted incrementally
+    with app.app_context():
+        alert_service.rebuild_alert_counters()
+        db.session.commit()
+    
+    # Alert checks, reports and cleanup run from the Job table on their cron schedules
+    job_scheduler.start(app)
     
-    # Schedule daily checks at 9:00 AM
-    schedule.every().day.at("09:00").do(run_daily_alerts)
+    # Recover interrupted import jobs
+    schedule.every(5).minutes.do(resume_import_jobs)
     
-    # Also run checks every 4 hours during business hours
-    schedule.every(4).hours.do(run_daily_alerts)
+    # Deliver queued emails
+    schedule.every(1).minutes.do(deliver_notifications)
     
-    # Run initial check
-    run_daily_alerts()
+    resume_import_jobs()
+    deliver_notifications()
     
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
+    try:
+        while True:
+            schedule.run_pending()
+            time.sleep(60)  # Check every minute
+    finally:
+        job_scheduler.stop(app)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
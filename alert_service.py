@@ -1,70 +1,136 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
+import os
+import time
 import uuid
-from models import db, Alert, EmailNotification, Account, Consumer, User, PromiseToPay
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from models import (db, conflict_insert, alert_dedupe_key, Alert, AlertCounter, AlertWatermark, Account, AREvent,
+                    Consumer, Escalation, EscalationRule, User, PromiseToPay,
+                    ALERT_COUNTER_STATUSES, ALERT_COUNTER_PRIORITIES)
 from sqlalchemy import and_, or_
+from sqlalchemy.orm import aliased, joinedload
+from notification_outbox import notification_outbox
+from alert_stream import alert_broker, track_alert_changes
 
-class EmailService:
-    def __init__(self, smtp_server="smtp.gmail.com", smtp_port=587, username="", password=""):
-        self.smtp_server = smtp_server
-        self.smtp_port = smtp_port
-        self.username = username
-        self.password = password
-    
-    def send_email(self, to_email, subject, body):
-        """Send email notification"""
+class RecipientDirectory:
+    """Who gets alert notifications, loaded once per check run from a single user query"""
+    
+    def __init__(self, users):
+        self.user_emails = {}  # user_id -> (email, region_id), active or not, as the assignee may be inactive
+        self.region_managers = {}  # region_id -> active manager emails
+        self.admins = []  # active administrator emails
+        for user_id, email, role, region_id, active in users:
+            self.user_emails[user_id] = (email, region_id)
+            if not active or not email:
+                continue
+            if role == 'collections_manager' and region_id:
+                self.region_managers.setdefault(region_id, []).append(email)
+            elif role == 'administrator':
+                self.admins.append(email)
+    
+    @classmethod
+    def load(cls):
+        return cls(db.session.query(User.id, User.email, User.role, User.region_id, User.active).all())
+    
+    def recipients(self, assigned_to, priority):
+        """Assigned officer, the managers of the officer's region and, for critical alerts, administrators"""
+        recipients = set()
+        email, region_id = self.user_emails.get(assigned_to, (None, None))
+        if email:
+            recipients.add(email)
+        if region_id:
+            recipients.update(self.region_managers.get(region_id, []))
+        if priority == 'critical':
+            recipients.update(self.admins)
+        return sorted(recipients)
+
+
+PRIORITY_ORDER = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+DIGEST_MAX_LISTED = 200  # Alerts listed in a digest body; the rest are summarised as a count
+ALERT_CHECK_WORKERS = os.cpu_count() or 1
+PARTITIONS_PER_WORKER = 2  # Smaller account ranges even out partitions that finish early
+MIN_PARTITION_ACCOUNTS = 1000  # Below this many accounts per partition the checks run serially
+SINGLE_WRITER_DIALECTS = ('sqlite',)  # Databases whose checks always run serially
+ALERT_CHECKS = ('payment_due', 'payment_overdue', 'high_priority')
+WATERMARK_OVERLAP = timedelta(minutes=10)  # Re-read rows from transactions still open when the last run started
+DEFAULT_ESCALATION_RULES = (
+    {'name': 'Critical Account', 'min_balance': 200000, 'max_balance': None, 'min_age_days': 30,
+     'cadence_days': 30, 'priority': 'critical'},
+    {'name': 'High Priority Account', 'min_balance': 100000, 'max_balance': 200000, 'min_age_days': 90,
+     'cadence_days': 30, 'priority': 'high'},
+)
+ESCALATION_PRIORITY = {'critical': 'urgent'}  # Escalations have no 'critical' level
+OPEN_ESCALATION_WINDOW = timedelta(days=5)  # An open escalation this recent suppresses another
+
+
+def uses_recipient_directory(method):
+    """Give a check run one RecipientDirectory, shared by nested checks and dropped when the run ends.
+    
+    In digest mode the run also collects new alerts per recipient, queued as one summary
+    email each when the outermost check finishes.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.directory is not None:
+            return method(self, *args, **kwargs)
+        self.directory = RecipientDirectory.load()
+        self.pending_digests = {} if self.digest else None
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.username
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            msg.attach(MIMEText(body, 'html'))
-            
-            # For demo purposes, we'll just log the email instead of actually sending
-            print(f"EMAIL SENT TO: {to_email}")
-            print(f"SUBJECT: {subject}")
-            print(f"BODY: {body[:200]}...")
-            return True
-            
-            # Uncomment below for actual email sending
-            # server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            # server.starttls()
-            # server.login(self.username, self.password)
-            # text = msg.as_string()
-            # server.sendmail(self.username, to_email, text)
-            # server.quit()
-            # return True
-        except Exception as e:
-            print(f"Failed to send email: {str(e)}")
-            return False
+            return method(self, *args, **kwargs)
+        except Exception:
+            # Alerts the failing check left uncommitted are dropped; earlier checks' alerts still get their digest
+            db.session.rollback()
+            raise
+        finally:
+            digests, self.pending_digests = self.pending_digests, None
+            self.directory = None
+            if digests:
+                self.queue_digests(digests)
+    return wrapper
+
+
+def run_state(name, doc):
+    """Attribute of the check run in progress on the calling thread, None outside a run"""
+    return property(
+        lambda self: getattr(self.run, name, None),
+        lambda self, value: setattr(self.run, name, value),
+        doc=doc
+    )
+
 
 class AlertService:
-    def __init__(self, email_service=None):
-        self.email_service = email_service or EmailService()
+    # Check runs keep their state per thread: scheduled jobs and API calls can run checks on
+    # the shared instance at the same time, and must not see each other's digests or watermarks
+    watermarks = run_state('watermarks', '{check name: last evaluated} for an incremental run; None rescans everything')
+    directory = run_state('directory', 'RecipientDirectory for the check run in progress')
+    pending_digests = run_state('pending_digests', 'recipient email -> alert ids collected by the run in progress')
+    
+    def __init__(self, outbox=None, digest=False, workers=None, partition=None):
+        self.outbox = outbox or notification_outbox  # Email goes out through the outbox's pooled SMTP sender
+        self.digest = digest  # One summary email per recipient per run instead of one per alert
+        self.workers = workers or ALERT_CHECK_WORKERS
+        self.partition = partition  # (low, high) account id range checked by this instance; None for all
+        self.run = threading.local()
     
     def create_alert(self, alert_type, title, message, priority='medium', account_id=None, 
                     consumer_id=None, assigned_to=None, due_date=None):
-        """Create a new alert"""
-        alert = Alert(
-            id=str(uuid.uuid4()),
-            alert_type=alert_type,
-            title=title,
-            message=message,
-            priority=priority,
-            account_id=account_id,
-            consumer_id=consumer_id,
-            assigned_to=assigned_to,
-            due_date=due_date
-        )
-        db.session.add(alert)
-        db.session.commit()
-        return alert
+        """Create a new alert, or return None if an identical alert is already active; callers commit"""
+        alert_ids = self.insert_alerts([{
+            'alert_type': alert_type,
+            'title': title,
+            'message': message,
+            'priority': priority,
+            'account_id': account_id,
+            'consumer_id': consumer_id,
+            'assigned_to': assigned_to,
+            'due_date': due_date
+        }])
+        return db.session.get(Alert, alert_ids[0]) if alert_ids else None
     
-    def send_notification_email(self, alert, recipient_email):
-        """Send email notification for alert"""
+    def queue_notification_email(self, alert, recipient_email):
+        """Queue an email notification for alert in the outbox; callers commit"""
         subject = f"[{alert.priority.upper()}] {alert.title}"
         
         body = f"""
@@ -84,319 +150,564 @@ class AlertService:
         </html>
         """
         
-        # Create email notification record
-        notification = EmailNotification(
-            id=str(uuid.uuid4()),
-            recipient_email=recipient_email,
-            subject=subject,
-            body=body,
-            alert_id=alert.id
-        )
-        db.session.add(notification)
+        # Delivered later by the outbox worker, never inline with alert generation
+        return self.outbox.queue(recipient_email, subject, body, alert_id=alert.id)
+    
+    def queue_digest_email(self, alerts, recipient_email):
+        """Queue one summary email for alerts (ordered by priority), linked to all of them; callers commit"""
+        if len(alerts) == 1:
+            return self.queue_notification_email(alerts[0], recipient_email)
+        
+        counts = {}
+        for alert in alerts:
+            counts[alert.priority] = counts.get(alert.priority, 0) + 1
+        breakdown = ', '.join(f'{counts[p]} {p}' for p in PRIORITY_ORDER if p in counts)
+        subject = f"[{alerts[0].priority.upper()}] {len(alerts)} new collections alerts ({breakdown})"
+        
+        rows = ''.join(f"""
+                <tr>
+                    <td>{alert.priority.upper()}</td>
+                    <td>{alert.alert_type.replace('_', ' ').title()}</td>
+                    <td>{alert.title}</td>
+                    <td>{alert.message}</td>
+                    <td>{alert.due_date.strftime("%Y-%m-%d") if alert.due_date else ''}</td>
+                    <td>{f'{alert.consumer.first_name} {alert.consumer.last_name}' if alert.consumer else ''}</td>
+                </tr>""" for alert in alerts[:DIGEST_MAX_LISTED])
+        more = len(alerts) - DIGEST_MAX_LISTED
+        
+        body = f"""
+        <html>
+        <body>
+            <h2>Collections Alert Digest</h2>
+            <p><strong>{len(alerts)} new alerts:</strong> {breakdown}</p>
+            <table border="1" cellpadding="4" cellspacing="0">
+                <tr><th>Priority</th><th>Type</th><th>Alert</th><th>Message</th><th>Due Date</th><th>Consumer</th></tr>{rows}
+            </table>
+            {f'<p>...and {more} more alerts. See the alerts dashboard for the full list.</p>' if more > 0 else ''}
+            <p><strong>Generated:</strong> {datetime.utcnow().strftime("%Y-%m-%d %H:%M")}</p>
+            <hr>
+            <p><small>DM9 Collections Management System</small></p>
+        </body>
+        </html>
+        """
         
-        # Send email
-        if self.email_service.send_email(recipient_email, subject, body):
-            notification.status = 'sent'
-            notification.sent_at = datetime.utcnow()
-        else:
-            notification.status = 'failed'
+        return self.outbox.queue(recipient_email, subject, body, alerts=alerts)
+    
+    def queue_digests(self, digests):
+        """Queue one digest per recipient from {email: [alert id]} and commit.
+        
+        Alerts are reloaded in one query, so any rolled back since they were collected are left out.
+        """
+        alert_ids = {alert_id for ids in digests.values() for alert_id in ids}
+        alerts = {
+            alert.id: alert
+            for alert in Alert.query.options(joinedload(Alert.consumer)).filter(Alert.id.in_(alert_ids))
+        }
+        
+        def order(alert):
+            return (PRIORITY_ORDER.get(alert.priority, len(PRIORITY_ORDER)), alert.due_date or datetime.max.date(), alert.created_at)
         
+        queued = 0
+        for email, ids in digests.items():
+            recipient_alerts = sorted((alerts[alert_id] for alert_id in ids if alert_id in alerts), key=order)
+            if recipient_alerts:
+                self.queue_digest_email(recipient_alerts, email)
+                queued += 1
         db.session.commit()
-        return notification
+        return queued
+    
+    def load_watermarks(self):
+        return dict(db.session.query(AlertWatermark.check_name, AlertWatermark.evaluated_at).all())
+    
+    def save_watermarks(self, started_at, full_scan=False):
+        """Advance every check's watermark to the start of a successful run and commit.
+        
+        Overlapping runs may finish in either order, so watermarks only ever move forward.
+        """
+        table = AlertWatermark.__table__
+        checks = table.c.check_name.in_(ALERT_CHECKS)
+        # A check's first run evaluates everything, so it also counts as its first full scan
+        db.session.execute(conflict_insert(table).on_conflict_do_nothing(index_elements=[table.c.check_name]), [
+            {'check_name': check_name, 'evaluated_at': started_at, 'full_scan_at': started_at}
+            for check_name in ALERT_CHECKS
+        ])
+        db.session.execute(table.update().where(checks, table.c.evaluated_at < started_at).values(evaluated_at=started_at))
+        if full_scan:
+            db.session.execute(table.update().where(
+                checks, or_(table.c.full_scan_at.is_(None), table.c.full_scan_at < started_at)
+            ).values(full_scan_at=started_at))
+        db.session.commit()
+    
+    def _since(self, check_name):
+        """Where an incremental check resumes from, or None to scan everything"""
+        evaluated_at = (self.watermarks or {}).get(check_name)
+        return evaluated_at - WATERMARK_OVERLAP if evaluated_at else None
+    
+    def _escalation_dates(self, today, cadence_days):
+        """Placement dates whose age in days is a whole multiple of cadence_days today"""
+        oldest = db.session.query(db.func.min(Account.placement_date)).scalar()
+        if oldest is None:
+            return []
+        return [today - timedelta(days=days) for days in range(cadence_days, (today - oldest).days + 1, cadence_days)]
+    
+    def _account_changes(self, since, min_age_days, escalation_dates):
+        """Incremental account filter: rows changed since the watermark, accounts that passed min_age_days
+        since it, and (on the first run of a day) accounts due their periodic escalation"""
+        if since is None:
+            return db.true()
+        criteria = [
+            Account.updated_at >= since,
+            Account.placement_date >= since.date() - timedelta(days=min_age_days)
+        ]
+        if escalation_dates:
+            criteria.append(Account.placement_date.in_(escalation_dates))
+        return or_(*criteria)
+    
+    def in_partition(self, account_id):
+        """Restrict an account id column to this instance's partition"""
+        if self.partition is None:
+            return db.true()
+        low, high = self.partition
+        return and_(
+            account_id >= low if low is not None else db.true(),
+            account_id < high if high is not None else db.true()
+        )
+    
+    def partition_bounds(self, partitions):
+        """Split accounts into up to partitions contiguous id ranges of about equal size.
+        
+        Account ids are random UUIDs, so id ranges behave like hash buckets: each holds a
+        similar share of accounts, PTPs and alerts whatever the regional mix. Returns
+        [(low, high)] with None for an open end.
+        """
+        total = db.session.query(db.func.count(Account.id)).scalar()
+        partitions = min(partitions, total // MIN_PARTITION_ACCOUNTS)
+        if partitions <= 1:
+            return [(None, None)]
+        cuts = sorted({
+            db.session.query(Account.id).order_by(Account.id).offset(total * k // partitions).limit(1).scalar()
+            for k in range(1, partitions)
+        })
+        return list(zip([None] + cuts, cuts + [None]))
+    
+    def insert_alerts(self, rows):
+        """Bulk insert alert rows (dicts of Alert columns), returning the ids actually inserted.
+        
+        Rows that duplicate an active alert's dedupe key are dropped by the partial unique
+        index (ON CONFLICT DO NOTHING), so concurrent runs cannot double up alerts.
+        """
+        if not rows:
+            return []
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault('id', str(uuid.uuid4()))
+            row.setdefault('status', 'active')
+            row.setdefault('created_at', now)
+            row.setdefault('updated_at', row['created_at'])
+            row['dedupe_key'] = alert_dedupe_key(row['alert_type'], row.get('account_id'), row.get('due_date'))
+        
+        stmt = conflict_insert(Alert.__table__).on_conflict_do_nothing(
+            index_elements=[Alert.dedupe_key],
+            index_where=db.text("status = 'active'")
+        ).returning(Alert.id)
+        alert_ids = db.session.execute(stmt, rows).scalars().all()
+        
+        track_alert_changes(alert_ids)
+        inserted = set(alert_ids)
+        self.update_alert_counters([
+            (row.get('assigned_to'), row['status'], row.get('priority') or 'medium', 1)
+            for row in rows if row['id'] in inserted
+        ])
+        return alert_ids
+    
+    def counter_scopes(self, assigned_to, region_id):
+        """Counters an alert counts towards: everyone's, its assignee's and the assignee's region's"""
+        scopes = ['all']
+        if assigned_to:
+            scopes.append(f'user:{assigned_to}')
+        if region_id:
+            scopes.append(f'region:{region_id}')
+        return scopes
+    
+    def _user_regions(self, user_ids):
+        if self.directory is not None:
+            return {user_id: self.directory.user_emails.get(user_id, (None, None))[1] for user_id in user_ids}
+        return dict(db.session.query(User.id, User.region_id).filter(User.id.in_(user_ids)).all()) if user_ids else {}
+    
+    def _counter_totals(self, changes):
+        """{scope: {column: delta}} from [(assigned_to, region_id, status, priority, delta)]"""
+        totals = {}
+        for assigned_to, region_id, status, priority, delta in changes:
+            if status not in ALERT_COUNTER_STATUSES or priority not in ALERT_COUNTER_PRIORITIES:
+                continue
+            column = f'{status}_{priority}'
+            for scope in self.counter_scopes(assigned_to, region_id):
+                scope_totals = totals.setdefault(scope, {})
+                scope_totals[column] = scope_totals.get(column, 0) + delta
+        return totals
+    
+    def update_alert_counters(self, changes):
+        """Apply [(assigned_to, status, priority, delta)] to the badge counters with atomic increments; callers commit"""
+        changes = [change for change in changes if change[3]]
+        if not changes:
+            return
+        regions = self._user_regions({change[0] for change in changes if change[0]})
+        totals = self._counter_totals(
+            (assigned_to, regions.get(assigned_to), status, priority, delta)
+            for assigned_to, status, priority, delta in changes
+        )
+        
+        table = AlertCounter.__table__
+        db.session.execute(conflict_insert(table).on_conflict_do_nothing(index_elements=[table.c.scope]),
+                           [{'scope': scope} for scope in totals])
+        for scope in sorted(totals):  # A fixed lock order, so concurrent runs cannot deadlock
+            db.session.execute(table.update().where(table.c.scope == scope).values({
+                table.c[column]: table.c[column] + delta for column, delta in totals[scope].items()
+            }))
+    
+    def count_status_change(self, alert, old_status):
+        """Move an alert between status counters after acknowledge/resolve; callers commit"""
+        if alert.status != old_status:
+            self.update_alert_counters([
+                (alert.assigned_to, old_status, alert.priority, -1),
+                (alert.assigned_to, alert.status, alert.priority, 1)
+            ])
+    
+    def rebuild_alert_counters(self):
+        """Recompute every counter from the alert table, e.g. after officers change region; callers commit"""
+        totals = self._counter_totals(db.session.query(
+            Alert.assigned_to, User.region_id, Alert.status, Alert.priority, db.func.count(Alert.id)
+        ).outerjoin(User, User.id == Alert.assigned_to).group_by(
+            Alert.assigned_to, User.region_id, Alert.status, Alert.priority
+        ).all())
+        columns = {f'{status}_{priority}': 0 for status in ALERT_COUNTER_STATUSES for priority in ALERT_COUNTER_PRIORITIES}
+        db.session.execute(db.delete(AlertCounter))
+        if totals:
+            # Every row binds every column, or executemany rejects rows missing some buckets
+            db.session.execute(AlertCounter.__table__.insert(), [
+                dict(columns, scope=scope, **counts) for scope, counts in totals.items()
+            ])
     
+    def alert_counts(self, scope):
+        """{status: {priority: n, ..., 'total': n}} for a badge scope, read from its single counter row"""
+        counter = db.session.get(AlertCounter, scope)  # Seeded by `flask rebuild-alert-counters` at deploy
+        
+        counts = {}
+        for status in ALERT_COUNTER_STATUSES:
+            by_priority = {priority: getattr(counter, f'{status}_{priority}') if counter else 0
+                           for priority in ALERT_COUNTER_PRIORITIES}
+            counts[status] = dict(by_priority, total=sum(by_priority.values()))
+        return counts
+    
+    def _ptp_has_active_alert(self, alert_type):
+        """Correlated EXISTS: an active alert of alert_type for the PTP's account and promised date"""
+        return db.exists().where(
+            Alert.alert_type == alert_type,
+            Alert.account_id == PromiseToPay.account_id,
+            Alert.due_date == PromiseToPay.promised_date,
+            Alert.status == 'active'
+        )
+    
+    def ptp_alert_candidates(self, alert_type, *criteria):
+        """Active PTPs matching criteria that have no active alert of alert_type for the same account and date.
+        
+        One query: PTPs joined to their account and consumer, left anti-joined to alerts.
+        """
+        return db.session.query(
+            PromiseToPay.account_id, PromiseToPay.consumer_id, PromiseToPay.promised_amount,
+            PromiseToPay.promised_date, Account.account_number, Account.assigned_officer_id,
+            Consumer.first_name, Consumer.last_name
+        ).join(Account, Account.id == PromiseToPay.account_id).join(
+            Consumer, Consumer.id == PromiseToPay.consumer_id
+        ).filter(
+            PromiseToPay.status == 'active',
+            self.in_partition(PromiseToPay.account_id),
+            ~self._ptp_has_active_alert(alert_type),
+            *criteria
+        ).order_by(PromiseToPay.promised_date, PromiseToPay.account_id).all()
+    
+    def _unique_ptp_alerts(self, candidates, build):
+        """One alert per (account, due date), even when several PTPs share it"""
+        rows = {}
+        for ptp in candidates:
+            rows.setdefault((ptp.account_id, ptp.promised_date), build(ptp))
+        return list(rows.values())
+    
+    def _notify_new_alerts(self, alert_ids):
+        if not alert_ids:
+            return
+        if self.pending_digests is not None:
+            # Digests are rendered when the run ends; only recipients are needed now
+            for alert_id, assigned_to, priority in db.session.query(Alert.id, Alert.assigned_to, Alert.priority).filter(Alert.id.in_(alert_ids)):
+                self._add_to_digests(alert_id, assigned_to, priority)
+            return
+        for alert in Alert.query.options(joinedload(Alert.consumer)).filter(Alert.id.in_(alert_ids)):
+            self._queue_alert_notifications(alert)
+    
+    @uses_recipient_directory
     def check_payment_due_alerts(self):
         """Check for payments due in 5 days and create alerts"""
-        five_days_from_now = datetime.utcnow().date() + timedelta(days=5)
-        
-        # Check Promise to Pay due dates
-        ptps_due = PromiseToPay.query.filter(
-            and_(
-                PromiseToPay.promised_date == five_days_from_now,
-                PromiseToPay.status == 'active'
+        today = datetime.utcnow().date()
+        five_days_from_now = today + timedelta(days=5)
+        due = PromiseToPay.promised_date == five_days_from_now
+        since = self._since('payment_due')
+        if since:
+            # Dates that came within five days since the last run, plus PTPs added or changed since
+            due = or_(
+                and_(
+                    PromiseToPay.promised_date > since.date() + timedelta(days=5),
+                    PromiseToPay.promised_date >= today,
+                    PromiseToPay.promised_date <= five_days_from_now
+                ),
+                and_(PromiseToPay.updated_at >= since, due)
             )
-        ).all()
         
-        for ptp in ptps_due:
-            # Check if alert already exists
-            existing_alert = Alert.query.filter(
-                and_(
-                    Alert.alert_type == 'payment_due',
-                    Alert.account_id == ptp.account_id,
-                    Alert.due_date == ptp.promised_date,
-                    Alert.status == 'active'
-                )
-            ).first()
-            
-            if not existing_alert:
-                alert = self.create_alert(
-                    alert_type='payment_due',
-                    title=f'Payment Due in 5 Days - {ptp.account.account_number}',
-                    message=f'Customer {ptp.consumer.first_name} {ptp.consumer.last_name} has a payment of KES {ptp.promised_amount:,.2f} due on {ptp.promised_date.strftime("%Y-%m-%d")}',
-                    priority='high',
-                    account_id=ptp.account_id,
-                    consumer_id=ptp.consumer_id,
-                    assigned_to=ptp.account.assigned_officer_id,
-                    due_date=ptp.promised_date
-                )
-                
-                # Send notifications to assigned officer and manager
-                self._send_alert_notifications(alert)
+        candidates = self.ptp_alert_candidates('payment_due', due)
+        alert_ids = self.insert_alerts(self._unique_ptp_alerts(candidates, lambda ptp: {
+            'alert_type': 'payment_due',
+            'title': f'Payment Due in {(ptp.promised_date - today).days} Days - {ptp.account_number}',
+            'message': f'Customer {ptp.first_name} {ptp.last_name} has a payment of KES {ptp.promised_amount:,.2f} due on {ptp.promised_date.strftime("%Y-%m-%d")}',
+            'priority': 'high',
+            'account_id': ptp.account_id,
+            'consumer_id': ptp.consumer_id,
+            'assigned_to': ptp.assigned_officer_id,
+            'due_date': ptp.promised_date
+        }))
+        
+        # Queue notifications to assigned officer and manager with the alerts
+        self._notify_new_alerts(alert_ids)
+        db.session.commit()
+        return len(alert_ids)
     
+    @uses_recipient_directory
     def check_overdue_payments(self):
-        """Check for overdue payments and create alerts"""
+        """Check for overdue payments, create alerts and mark the PTPs broken"""
         today = datetime.utcnow().date()
+        overdue = PromiseToPay.promised_date < today
+        since = self._since('payment_overdue')
+        if since:
+            # Only dates that fell due since the last run, plus PTPs added or changed since
+            overdue = and_(overdue, or_(PromiseToPay.promised_date >= since.date(), PromiseToPay.updated_at >= since))
         
-        # Check overdue Promise to Pay
-        overdue_ptps = PromiseToPay.query.filter(
-            and_(
-                PromiseToPay.promised_date < today,
-                PromiseToPay.status == 'active'
-            )
-        ).all()
+        candidates = self.ptp_alert_candidates('payment_overdue', overdue)
         
-        for ptp in overdue_ptps:
+        def build(ptp):
             days_overdue = (today - ptp.promised_date).days
-            
-            # Check if alert already exists for this overdue payment
-            existing_alert = Alert.query.filter(
-                and_(
-                    Alert.alert_type == 'payment_overdue',
-                    Alert.account_id == ptp.account_id,
-                    Alert.due_date == ptp.promised_date,
-                    Alert.status == 'active'
-                )
-            ).first()
-            
-            if not existing_alert:
-                priority = 'critical' if days_overdue > 7 else 'high'
-                
-                alert = self.create_alert(
-                    alert_type='payment_overdue',
-                    title=f'Payment Overdue - {ptp.account.account_number}',
-                    message=f'Customer {ptp.consumer.first_name} {ptp.consumer.last_name} payment of KES {ptp.promised_amount:,.2f} is {days_overdue} days overdue (due: {ptp.promised_date.strftime("%Y-%m-%d")})',
-                    priority=priority,
-                    account_id=ptp.account_id,
-                    consumer_id=ptp.consumer_id,
-                    assigned_to=ptp.account.assigned_officer_id,
-                    due_date=ptp.promised_date
-                )
-                
-                # Mark PTP as broken
-                ptp.status = 'broken'
-                ptp.broken_date = datetime.utcnow()
-                
-                # Send notifications
-                self._send_alert_notifications(alert)
+            return {
+                'alert_type': 'payment_overdue',
+                'title': f'Payment Overdue - {ptp.account_number}',
+                'message': f'Customer {ptp.first_name} {ptp.last_name} payment of KES {ptp.promised_amount:,.2f} is {days_overdue} days overdue (due: {ptp.promised_date.strftime("%Y-%m-%d")})',
+                'priority': 'critical' if days_overdue > 7 else 'high',
+                'account_id': ptp.account_id,
+                'consumer_id': ptp.consumer_id,
+                'assigned_to': ptp.assigned_officer_id,
+                'due_date': ptp.promised_date
+            }
+        
+        # Mark the same PTPs broken with one UPDATE, before their alerts exist
+        db.session.execute(db.update(PromiseToPay).where(
+            PromiseToPay.status == 'active',
+            self.in_partition(PromiseToPay.account_id),
+            overdue,
+            ~self._ptp_has_active_alert('payment_overdue')
+        ).values(status='broken', broken_date=datetime.utcnow()).execution_options(synchronize_session=False))
+        alert_ids = self.insert_alerts(self._unique_ptp_alerts(candidates, build))
         
+        # Queue notifications with the alerts
+        self._notify_new_alerts(alert_ids)
         db.session.commit()
+        return len(alert_ids)
     
-    def check_high_priority_accounts(self):
-        """Check for high priority accounts (high balance, long overdue) and auto-escalate after 30 days"""
-        from models import Escalation, AREvent
-        
-        # Accounts with balance > 200,000 KES (Critical Risk) or > 100,000 KES (High Risk)
-        thirty_days_ago = datetime.utcnow().date() - timedelta(days=30)
-        ninety_days_ago = datetime.utcnow().date() - timedelta(days=90)
-        
-        # Critical accounts (>200K, >30 days)
-        critical_accounts = Account.query.filter(
-            and_(
-                Account.current_balance > 200000,
-                Account.placement_date < thirty_days_ago,
-                Account.status == 'active'
-            )
-        ).all()
+    def install_default_escalation_rules(self):
+        """Store the built-in rules the first time escalation runs against an empty rule table"""
+        if db.session.query(EscalationRule.id).first() is None:
+            db.session.execute(EscalationRule.__table__.insert(), [
+                dict(rule, id=str(uuid.uuid4()), active=True) for rule in DEFAULT_ESCALATION_RULES
+            ])
+            db.session.commit()
+    
+    def escalation_rules(self):
+        """Active escalation rules, highest balance band first, so an account matching two raises the higher one"""
+        self.install_default_escalation_rules()
+        return EscalationRule.query.filter_by(active=True).order_by(EscalationRule.min_balance.desc()).all()
+    
+    def escalation_candidates(self, rule, today, since=None, escalation_dates=None):
+        """Accounts matching rule in one query: joined to their officer's region manager, with an
+        EXISTS flag for a recent open escalation"""
+        officer = aliased(User)
+        managers = db.select(User.region_id, db.func.min(User.id).label('manager_id')).where(
+            User.role == 'collections_manager',
+            User.active.is_(True)
+        ).group_by(User.region_id).subquery()
+        open_escalation = db.exists().where(
+            Escalation.account_id == Account.id,
+            Escalation.status.in_(['pending', 'acknowledged']),
+            Escalation.created_at >= datetime.utcnow() - OPEN_ESCALATION_WINDOW
+        )
         
-        for account in critical_accounts:
-            days_since_placement = (datetime.utcnow().date() - account.placement_date).days
-            
-            # Auto-escalate every 30 days
-            if days_since_placement % 30 == 0:
-                # Check if escalation already exists for this period
-                existing_escalation = Escalation.query.filter(
-                    and_(
-                        Escalation.account_id == account.id,
-                        Escalation.status.in_(['pending', 'acknowledged']),
-                        Escalation.created_at >= datetime.utcnow() - timedelta(days=5)
-                    )
-                ).first()
-                
-                if not existing_escalation and account.assigned_officer_id:
-                    officer = User.query.get(account.assigned_officer_id)
-                    if officer and officer.region_id:
-                        manager = User.query.filter(
-                            and_(
-                                User.role == 'collections_manager',
-                                User.region_id == officer.region_id,
-                                User.active == True
-                            )
-                        ).first()
-                        
-                        if manager:
-                            escalation = Escalation(
-                                id=str(uuid.uuid4()),
-                                account_id=account.id,
-                                escalated_by=account.assigned_officer_id,
-                                escalated_to=manager.id,
-                                reason=f'Auto-escalation: Critical account (KES {account.current_balance:,.2f}) overdue for {days_since_placement} days',
-                                priority='critical'
-                            )
-                            db.session.add(escalation)
-                            
-                            ar_event = AREvent(
-                                id=str(uuid.uuid4()),
-                                account_id=account.id,
-                                event_type='escalation',
-                                description=f'Auto-escalated to manager after {days_since_placement} days',
-                                created_by=account.assigned_officer_id
-                            )
-                            db.session.add(ar_event)
-            
-            # Create alert
-            existing_alert = Alert.query.filter(
-                and_(
-                    Alert.alert_type == 'high_priority',
-                    Alert.account_id == account.id,
-                    Alert.status == 'active'
-                )
-            ).first()
-            
-            if not existing_alert:
-                alert = self.create_alert(
-                    alert_type='high_priority',
-                    title=f'Critical Account - {account.account_number}',
-                    message=f'Account with balance KES {account.current_balance:,.2f} has been active for {days_since_placement} days without resolution',
-                    priority='critical',
-                    account_id=account.id,
-                    consumer_id=account.consumer_id,
-                    assigned_to=account.assigned_officer_id
-                )
-                self._send_alert_notifications(alert)
-        
-        # High priority accounts (>100K, >90 days)
-        high_priority_accounts = Account.query.filter(
-            and_(
-                Account.current_balance > 100000,
-                Account.current_balance <= 200000,
-                Account.placement_date < ninety_days_ago,
-                Account.status == 'active'
-            )
-        ).all()
+        query = db.session.query(
+            Account.id, Account.account_number, Account.current_balance, Account.placement_date,
+            Account.consumer_id, Account.assigned_officer_id, managers.c.manager_id,
+            open_escalation.label('escalated')
+        ).outerjoin(officer, officer.id == Account.assigned_officer_id).outerjoin(
+            managers, managers.c.region_id == officer.region_id
+        ).filter(
+            Account.current_balance > rule.min_balance,
+            Account.placement_date < today - timedelta(days=rule.min_age_days),
+            Account.status == 'active',
+            self.in_partition(Account.id),
+            self._account_changes(since, rule.min_age_days, escalation_dates)
+        )
+        if rule.max_balance is not None:
+            query = query.filter(Account.current_balance <= rule.max_balance)
+        return query.order_by(Account.id).all()
+    
+    @uses_recipient_directory
+    def check_high_priority_accounts(self):
+        """Raise alerts for accounts matching the escalation rules, auto-escalating on each rule's cadence"""
+        today = datetime.utcnow().date()
+        now = datetime.utcnow()
+        since = self._since('high_priority')
+        created = 0
         
-        for account in high_priority_accounts:
-            days_since_placement = (datetime.utcnow().date() - account.placement_date).days
-            
-            # Auto-escalate every 30 days
-            if days_since_placement % 30 == 0:
-                existing_escalation = Escalation.query.filter(
-                    and_(
-                        Escalation.account_id == account.id,
-                        Escalation.status.in_(['pending', 'acknowledged']),
-                        Escalation.created_at >= datetime.utcnow() - timedelta(days=5)
-                    )
-                ).first()
+        for rule in self.escalation_rules():
+            escalation_dates = self._escalation_dates(today, rule.cadence_days) if since and since.date() < today else []
+            alerts, escalations, events = [], [], []
+            for account in self.escalation_candidates(rule, today, since, escalation_dates):
+                days_since_placement = (today - account.placement_date).days
+                alerts.append({
+                    'alert_type': 'high_priority',
+                    'title': f'{rule.name} - {account.account_number}',
+                    'message': f'Account with balance KES {account.current_balance:,.2f} has been active for {days_since_placement} days without resolution',
+                    'priority': rule.priority,
+                    'account_id': account.id,
+                    'consumer_id': account.consumer_id,
+                    'assigned_to': account.assigned_officer_id
+                })
                 
-                if not existing_escalation and account.assigned_officer_id:
-                    officer = User.query.get(account.assigned_officer_id)
-                    if officer and officer.region_id:
-                        manager = User.query.filter(
-                            and_(
-                                User.role == 'collections_manager',
-                                User.region_id == officer.region_id,
-                                User.active == True
-                            )
-                        ).first()
-                        
-                        if manager:
-                            escalation = Escalation(
-                                id=str(uuid.uuid4()),
-                                account_id=account.id,
-                                escalated_by=account.assigned_officer_id,
-                                escalated_to=manager.id,
-                                reason=f'Auto-escalation: High-risk account (KES {account.current_balance:,.2f}) overdue for {days_since_placement} days',
-                                priority='high'
-                            )
-                            db.session.add(escalation)
-                            
-                            ar_event = AREvent(
-                                id=str(uuid.uuid4()),
-                                account_id=account.id,
-                                event_type='escalation',
-                                description=f'Auto-escalated to manager after {days_since_placement} days',
-                                created_by=account.assigned_officer_id
-                            )
-                            db.session.add(ar_event)
+                # Auto-escalate to the region manager on the rule's cadence
+                if days_since_placement % rule.cadence_days or account.escalated or not account.manager_id:
+                    continue
+                escalations.append({
+                    'id': str(uuid.uuid4()),
+                    'account_id': account.id,
+                    'escalated_by': account.assigned_officer_id,
+                    'escalated_to': account.manager_id,
+                    'reason': f'Auto-escalation: {rule.name} (KES {account.current_balance:,.2f}) overdue for {days_since_placement} days',
+                    'status': 'pending',
+                    'priority': ESCALATION_PRIORITY.get(rule.priority, rule.priority),
+                    'created_at': now
+                })
+                events.append({
+                    'id': str(uuid.uuid4()),
+                    'account_id': account.id,
+                    'event_type': 'escalation',
+                    'description': f'Auto-escalated to manager after {days_since_placement} days',
+                    'created_by': account.assigned_officer_id,
+                    'created_at': now
+                })
             
-            existing_alert = Alert.query.filter(
-                and_(
-                    Alert.alert_type == 'high_priority',
-                    Alert.account_id == account.id,
-                    Alert.status == 'active'
-                )
-            ).first()
-            
-            if not existing_alert:
-                alert = self.create_alert(
-                    alert_type='high_priority',
-                    title=f'High Priority Account - {account.account_number}',
-                    message=f'Account with balance KES {account.current_balance:,.2f} has been active for {days_since_placement} days without resolution',
-                    priority='high',
-                    account_id=account.id,
-                    consumer_id=account.consumer_id,
-                    assigned_to=account.assigned_officer_id
-                )
-                self._send_alert_notifications(alert)
+            if escalations:
+                db.session.execute(Escalation.__table__.insert(), escalations)
+                db.session.execute(AREvent.__table__.insert(), events)
+            # An already active alert for the account is suppressed by its dedupe key
+            alert_ids = self.insert_alerts(alerts)
+            self._notify_new_alerts(alert_ids)
+            created += len(alert_ids)
         
         db.session.commit()
+        return created
+    
+    def _queue_alert_notifications(self, alert):
+        """Queue alert notifications to relevant users"""
+        if self.pending_digests is not None:
+            self._add_to_digests(alert.id, alert.assigned_to, alert.priority)
+            return
+        directory = self.directory or RecipientDirectory.load()
+        for email in directory.recipients(alert.assigned_to, alert.priority):
+            self.queue_notification_email(alert, email)
+    
+    def _add_to_digests(self, alert_id, assigned_to, priority):
+        for email in self.directory.recipients(assigned_to, priority):
+            self.pending_digests.setdefault(email, []).append(alert_id)
     
-    def _send_alert_notifications(self, alert):
-        """Send alert notifications to relevant users"""
-        recipients = []
+    def _run_checks(self):
+        return {
+            'payment_due': self.check_payment_due_alerts(),
+            'payment_overdue': self.check_overdue_payments(),
+            'high_priority': self.check_high_priority_accounts()
+        }
+    
+    def _check_partition(self, app, partition):
+        """Run the checks over one account range on a worker thread, in its own app context, session and transactions.
         
-        # Add assigned officer
-        if alert.assigned_to:
-            officer = User.query.get(alert.assigned_to)
-            if officer and officer.email:
-                recipients.append(officer.email)
+        Returns the alert counts and, in digest mode, the recipients' alert ids for the coordinator to merge.
+        """
+        with app.app_context():
+            worker = AlertService(self.outbox, self.digest, partition=partition)
+            worker.directory = self.directory  # Read-only once loaded, so safely shared
+            worker.watermarks = self.watermarks
+            worker.pending_digests = {} if self.digest else None
+            try:
+                return worker._run_checks(), worker.pending_digests
+            except Exception:
+                db.session.rollback()
+                raise
+    
+    @uses_recipient_directory
+    def run_daily_checks(self, workers=None, full_scan=False):
+        """Run all daily alert checks, partitioned by account across a worker pool; returns run statistics.
         
-        # Add managers in the same region
-        if alert.assigned_user and alert.assigned_user.region_id:
-            managers = User.query.filter(
-                and_(
-                    User.role == 'collections_manager',
-                    User.region_id == alert.assigned_user.region_id,
-                    User.active == True
-                )
-            ).all()
-            
-            for manager in managers:
-                if manager.email:
-                    recipients.append(manager.email)
+        Runs are incremental from each check's watermark; full_scan re-evaluates everything as a repair.
+        """
+        print("Running daily alert checks...")
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        workers = workers or self.workers
+        if db.engine.dialect.name in SINGLE_WRITER_DIALECTS:
+            workers = 1  # Partitions would only queue on the database's write lock and time out
+        partitions = self.partition_bounds(workers * PARTITIONS_PER_WORKER) if workers > 1 else [(None, None)]
+        self.watermarks = {} if full_scan else self.load_watermarks()
+        self.install_default_escalation_rules()  # Before partitions race to do it
+        stats = {'partitions': len(partitions), 'workers': min(workers, len(partitions)),
+                 'fullScan': full_scan or len(self.watermarks) < len(ALERT_CHECKS),
+                 'payment_due': 0, 'payment_overdue': 0, 'high_priority': 0}
         
-        # Add administrators for critical alerts
-        if alert.priority == 'critical':
-            admins = User.query.filter(
-                and_(
-                    User.role == 'administrator',
-                    User.active == True
-                )
-            ).all()
-            
-            for admin in admins:
-                if admin.email:
-                    recipients.append(admin.email)
+        results, errors = [], []
+        try:
+            if len(partitions) == 1:
+                results.append((self._run_checks(), None))
+            else:
+                app = current_app._get_current_object()
+                with ThreadPoolExecutor(max_workers=stats['workers']) as pool:
+                    futures = [pool.submit(self._check_partition, app, partition) for partition in partitions]
+                for future in futures:
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        errors.append(e)
+        finally:
+            self.watermarks = None
         
-        # Send notifications
-        for email in set(recipients):  # Remove duplicates
-            self.send_notification_email(alert, email)
-    
-    def run_daily_checks(self):
-        """Run all daily alert checks"""
-        print("Running daily alert checks...")
-        self.check_payment_due_alerts()
-        self.check_overdue_payments()
-        self.check_high_priority_accounts()
-        print("Daily alert checks completed")
+        for counts, digests in results:
+            for key, count in counts.items():
+                stats[key] += count
+            for email, alert_ids in (digests or {}).items():
+                self.pending_digests.setdefault(email, []).extend(alert_ids)
+        if errors:
+            # Partitions that succeeded are committed and still get their digests; the watermarks stay put
+            raise RuntimeError(f"{len(errors)} of {len(partitions)} alert check partitions failed: {str(errors[0])}")
+        if full_scan:
+            self.rebuild_alert_counters()  # Repairs drift, e.g. from officers moving region
+        self.save_watermarks(started_at, full_scan)
+        
+        alert_broker.notify()
+        
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        if self.pending_digests is not None:
+            stats['digestRecipients'] = len(self.pending_digests)
+        print(f"Daily alert checks completed: {stats}")
+        return stats
 
 # Initialize alert service
-alert_service = AlertService()
\ No newline at end of file
+alert_service = AlertService(digest=True)
\ No newline at end of file
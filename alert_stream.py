@@ -0,0 +1,246 @@
+import json
+import queue
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+from models import db, Alert, Account, User
+
+FEED_INTERVAL = 2  # Seconds between feed reads when nothing in this process signalled a change
+FEED_OVERLAP = timedelta(seconds=5)  # Re-read window for commits in flight; changes are stamped as their commit starts
+KEEPALIVE_SECONDS = 20
+BACKLOG_LIMIT = 500  # Most alerts replayed to a reconnecting client
+SUBSCRIBER_QUEUE_SIZE = 1000  # A client this far behind is dropped and must reconnect with its cursor
+STAMP_CHUNK = 500  # Alert ids per commit-time UPDATE
+CHANGED_ALERTS = 'changed_alerts'  # session.info key: ids of alerts written in the current transaction
+
+
+def serialize_alert(a):
+    return {
+        'id': a.id, 'alertType': a.alert_type, 'title': a.title,
+        'message': a.message, 'priority': a.priority,
+        'accountId': a.account.account_number if a.account else a.account_id,
+        'accountNumber': a.account.account_number if a.account else None,
+        'consumerName': f"{a.account.consumer.first_name} {a.account.consumer.last_name}" if a.account and a.account.consumer else None,
+        'consumerId': a.consumer_id, 'assignedTo': a.assigned_to, 'status': a.status,
+        'dueDate': a.due_date.isoformat() if a.due_date else None,
+        'createdAt': a.created_at.isoformat()
+    }
+
+
+def alert_cursor(alert):
+    """Stream position of an alert change: its updated_at, then id to break ties"""
+    return f"{alert.updated_at.isoformat()}|{alert.id}"
+
+
+def parse_cursor(cursor):
+    stamp, _, alert_id = (cursor or '').partition('|')
+    try:
+        return datetime.fromisoformat(stamp), alert_id
+    except ValueError:
+        return None
+
+
+def alert_scope(user):
+    """User ids whose alerts a user may follow, or None for everyone's"""
+    if user.role == 'collections_officer':
+        return {user.id}
+    if user.role == 'collections_manager':
+        officers = db.session.query(User.id).filter_by(role='collections_officer', region_id=user.region_id)
+        return {officer_id for officer_id, in officers} | {user.id}
+    return None
+
+
+def track_alert_changes(alert_ids):
+    """Record alerts written with Core statements, so they are stamped when the transaction commits"""
+    db.session.info.setdefault(CHANGED_ALERTS, set()).update(alert_ids)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_flushed_alerts(session, flush_context):
+    changed = [obj.id for obj in session.new | session.dirty if isinstance(obj, Alert)]
+    if changed:
+        session.info.setdefault(CHANGED_ALERTS, set()).update(changed)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _stamp_alert_changes(session):
+    """Set updated_at on this transaction's alerts as it commits.
+
+    A check run can hold its transaction open for minutes; stamped at write time, its
+    alerts would become visible already older than the feed's cursor and never stream.
+    """
+    session.flush()
+    alert_ids = sorted(session.info.pop(CHANGED_ALERTS, ()))
+    if not alert_ids:
+        return
+    now = datetime.utcnow()
+    for start in range(0, len(alert_ids), STAMP_CHUNK):
+        session.execute(db.update(Alert).where(
+            Alert.id.in_(alert_ids[start:start + STAMP_CHUNK])
+        ).values(updated_at=now).execution_options(synchronize_session=False))
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_alert_changes(session):
+    session.info.pop(CHANGED_ALERTS, None)
+
+
+def _with_details(query):
+    return query.options(joinedload(Alert.account).joinedload(Account.consumer))
+
+
+class Subscription:
+    def __init__(self, user_ids):
+        self.user_ids = user_ids
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.replayed = {}  # alert id -> updated_at sent in the backlog, so the live feed skips repeats
+        self.dropped = False
+
+    def wants(self, event):
+        return self.user_ids is None or event['data']['assignedTo'] in self.user_ids
+
+    def fresh(self, event):
+        return self.replayed.get(event['data']['id']) != event['updatedAt']
+
+
+class AlertBroker:
+    """In-process publish/subscribe of alert changes for Server-Sent Event clients.
+
+    One feed thread per process reads alerts changed since its cursor (a single query
+    however many clients are connected) and fans them out to the matching subscribers.
+    Alerts are created by the scheduler process too, so the feed reads the database rather
+    than relying on in-process calls; notify() just wakes it early after a local change.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.recent = {}  # alert id -> updated_at published within FEED_OVERLAP
+
+    def notify(self):
+        """Signal that alerts changed in this process, so the feed reads them now"""
+        self.wakeup.set()
+
+    def event(self, alert, kind=None):
+        return {
+            'id': alert_cursor(alert),
+            'event': kind or ('created' if alert.status == 'active' and alert.acknowledged_at is None else 'updated'),
+            'updatedAt': alert.updated_at,
+            'data': dict(serialize_alert(alert), updatedAt=alert.updated_at.isoformat())
+        }
+
+    def latest_cursor(self):
+        alert = Alert.query.order_by(Alert.updated_at.desc(), Alert.id.desc()).first()
+        return alert_cursor(alert) if alert and alert.updated_at else None
+
+    def backlog(self, user_ids, cursor):
+        """Changes after a client's cursor, oldest first, within its scope"""
+        position = parse_cursor(cursor)
+        if position is None:
+            return []
+        stamp, alert_id = position
+        query = Alert.query.filter(db.or_(
+            Alert.updated_at > stamp,
+            db.and_(Alert.updated_at == stamp, Alert.id > alert_id)
+        ))
+        if user_ids is not None:
+            query = query.filter(Alert.assigned_to.in_(user_ids))
+        alerts = _with_details(query).order_by(Alert.updated_at, Alert.id).limit(BACKLOG_LIMIT).all()
+        return [self.event(alert) for alert in alerts]
+
+    def subscribe(self, app, user_ids):
+        subscription = Subscription(user_ids)
+        with self.lock:
+            self.subscribers.add(subscription)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._feed, args=(app,), name='alert-feed', daemon=True)
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, events):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            for event in events:
+                if not subscription.wants(event):
+                    continue
+                try:
+                    subscription.queue.put_nowait(event)
+                except queue.Full:
+                    # Too slow to keep up; end its stream so it reconnects from its cursor
+                    subscription.dropped = True
+                    self.unsubscribe(subscription)
+                    break
+
+    def _feed(self, app):
+        with app.app_context():
+            since = datetime.utcnow()
+            while True:
+                self.wakeup.wait(FEED_INTERVAL)
+                self.wakeup.clear()
+                with self.lock:
+                    if not self.subscribers:
+                        since = datetime.utcnow()  # Nobody listening; new subscribers catch up via backlog
+                        continue
+                try:
+                    started = datetime.utcnow()
+                    alerts = _with_details(Alert.query.filter(
+                        Alert.updated_at > since - FEED_OVERLAP
+                    )).order_by(Alert.updated_at, Alert.id).all()
+                    events = [
+                        self.event(alert) for alert in alerts
+                        if self.recent.get(alert.id) != alert.updated_at
+                    ]
+                    for event in events:
+                        self.recent[event['data']['id']] = event['updatedAt']
+                    self.recent = {
+                        alert_id: stamp for alert_id, stamp in self.recent.items()
+                        if stamp > started - FEED_OVERLAP * 2
+                    }
+                    since = started
+                    db.session.rollback()  # End the read transaction so the next read sees new commits
+                    if events:
+                        self.publish(events)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Alert feed error: {str(e)}")
+
+    def stream(self, subscription, backlog, ready_cursor=None):
+        """SSE lines for a subscription: the reconnect backlog, then live changes and keepalives.
+        
+        A full backlog page ends the stream, so the client reconnects from its last event id
+        for the next page instead of skipping ahead to live events.
+        """
+        try:
+            yield "retry: 1000\n\n"
+            if ready_cursor:
+                # First connection: where to resume from, for clients that drop before any alert
+                yield f"id: {ready_cursor}\nevent: ready\ndata: {{}}\n\n"
+            for event in backlog:
+                subscription.replayed[event['data']['id']] = event['updatedAt']
+                yield self.format(event)
+            if len(backlog) >= BACKLOG_LIMIT:
+                return
+            while not subscription.dropped:
+                try:
+                    event = subscription.queue.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscription.fresh(event):
+                    yield self.format(event)
+        finally:
+            self.unsubscribe(subscription)
+
+    def format(self, event):
+        return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+alert_broker = AlertBroker()
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.chart import BarChart, LineChart, PieChart, Reference
@@ -7,8 +7,14 @@ from flask_cors import CORS
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity, verify_jwt_in_request
 from models import *
 from alert_service import alert_service
+from alert_stream import alert_broker, alert_scope, serialize_alert
 from report_generator import report_generator
 from email_service import email_service
+from notification_outbox import notification_outbox
+from job_scheduler import job_scheduler, CronSchedule
+from import_service import import_service, LegalCaseImporter
+from assignment_service import assignment_service
+import os
 import uuid
 from datetime import datetime, timedelta
 import json
@@ -19,6 +25,7 @@ app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///collections.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = 'jwt-secret-key'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+app.config['IMPORT_SPOOL_DIR'] = os.path.join(app.instance_path, 'imports')
 
 db.init_app(app)
 jwt = JWTManager(app)
@@ -30,6 +37,36 @@ def create_response(success=True, data=None, error=None):
     if error is not None: response['error'] = error
     return jsonify(response)
 
+def run_file_import(job_type):
+    """Spool the uploaded file as a BatchJob and import it on the background workers"""
+    try:
+        if 'file' not in request.files:
+            return create_response(success=False, error={'message': 'No file provided'})
+        
+        file = request.files['file']
+        if file.filename == '':
+            return create_response(success=False, error={'message': 'No file selected'})
+        
+        job = import_service.create_job(job_type, file, get_jwt_identity(), app.config['IMPORT_SPOOL_DIR'])
+        
+        # ?wait=true processes the file inside the request, as before
+        if request.args.get('wait', 'false').lower() == 'true':
+            result = import_service.process_job(job.id)
+            return create_response(data={
+                'jobId': job.id,
+                'imported': result['imported'],
+                'failed': result['failed'],
+                'skipped': result['skipped'],
+                'errors': result['errors'][:10],  # Return first 10 errors
+                'counts': result['counts']
+            })
+        
+        import_service.submit(app, job.id)
+        return create_response(data={'jobId': job.id, 'status': 'pending', 'message': 'Import queued'})
+    except Exception as e:
+        db.session.rollback()
+        return create_response(success=False, error={'message': f'Import failed: {str(e)}'})
+
 # Authentication
 @app.route('/api/auth/login', methods=['POST'])
 def login():
@@ -117,33 +154,64 @@ def get_alerts():
     else:  # administrator
         alerts = Alert.query.filter_by(status='active').order_by(Alert.created_at.desc()).all()
     
-    return create_response(data=[{
-        'id': a.id, 'alertType': a.alert_type, 'title': a.title,
-        'message': a.message, 'priority': a.priority,
-        'accountId': a.account.account_number if a.account else a.account_id,
-        'accountNumber': a.account.account_number if a.account else None,
-        'consumerName': f"{a.account.consumer.first_name} {a.account.consumer.last_name}" if a.account and a.account.consumer else None,
-        'consumerId': a.consumer_id, 'assignedTo': a.assigned_to, 'status': a.status,
-        'dueDate': a.due_date.isoformat() if a.due_date else None,
-        'createdAt': a.created_at.isoformat()
-    } for a in alerts])
+    return create_response(data=[serialize_alert(a) for a in alerts])
+
+@app.route('/api/alerts/counts', methods=['GET'])
+@jwt_required()
+def get_alert_counts():
+    """Badge counts by status and priority: one counter row for the caller's scope"""
+    current_user = User.query.get(get_jwt_identity())
+    if current_user.role == 'collections_officer':
+        scope = f'user:{current_user.id}'
+    elif current_user.role == 'collections_manager':
+        scope = f'region:{current_user.region_id}'
+    else:
+        scope = 'all'
+    return create_response(data=alert_service.alert_counts(scope))
+
+@app.route('/api/alerts/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])  # EventSource cannot send headers; use ?jwt=<token>
+def stream_alerts():
+    """Server-Sent Events of new and changed alerts in the caller's scope.
+    
+    Reconnecting clients send Last-Event-ID (or ?cursor=) and first receive what they missed.
+    """
+    current_user = User.query.get(get_jwt_identity())
+    user_ids = alert_scope(current_user)
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    
+    # Subscribe before reading the backlog, so nothing committed in between is lost
+    subscription = alert_broker.subscribe(app, user_ids)
+    backlog = alert_broker.backlog(user_ids, cursor) if cursor else []
+    ready_cursor = None if cursor else alert_broker.latest_cursor()
+    db.session.close()  # Don't hold a connection for the life of the stream
+    
+    return Response(stream_with_context(alert_broker.stream(subscription, backlog, ready_cursor)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/alerts/<alert_id>/acknowledge', methods=['PUT'])
 @jwt_required()
 def acknowledge_alert(alert_id):
     alert = Alert.query.get_or_404(alert_id)
+    old_status = alert.status
     alert.status = 'acknowledged'
     alert.acknowledged_at = datetime.utcnow()
+    alert_service.count_status_change(alert, old_status)
     db.session.commit()
+    alert_broker.notify()
     return create_response(data={'message': 'Alert acknowledged'})
 
 @app.route('/api/alerts/<alert_id>/resolve', methods=['PUT'])
 @jwt_required()
 def resolve_alert(alert_id):
     alert = Alert.query.get_or_404(alert_id)
+    old_status = alert.status
     alert.status = 'resolved'
     alert.resolved_at = datetime.utcnow()
+    alert_service.count_status_change(alert, old_status)
     db.session.commit()
+    alert_broker.notify()
     return create_response(data={'message': 'Alert resolved'})
 
 @app.route('/api/alerts/run-checks', methods=['POST'])
@@ -154,8 +222,66 @@ def run_alert_checks():
     if current_user.role != 'administrator':
         return create_response(success=False, error={'message': 'Insufficient permissions'})
     
-    alert_service.run_daily_checks()
-    return create_response(data={'message': 'Alert checks completed'})
+    # fullScan re-evaluates every PTP and account instead of only what changed since the last run
+    data = request.get_json(silent=True) or {}
+    stats = alert_service.run_daily_checks(full_scan=bool(data.get('fullScan')))
+    return create_response(data={'message': 'Alert checks completed', 'stats': stats})
+
+def escalation_rule_data(rule):
+    return {
+        'id': rule.id, 'name': rule.name,
+        'minBalance': float(rule.min_balance),
+        'maxBalance': float(rule.max_balance) if rule.max_balance is not None else None,
+        'minAgeDays': rule.min_age_days, 'cadenceDays': rule.cadence_days,
+        'priority': rule.priority, 'active': rule.active
+    }
+
+@app.route('/api/alerts/escalation-rules', methods=['GET'])
+@jwt_required()
+def get_escalation_rules():
+    alert_service.install_default_escalation_rules()
+    rules = EscalationRule.query.order_by(EscalationRule.min_balance.desc()).all()
+    return create_response(data=[escalation_rule_data(r) for r in rules])
+
+@app.route('/api/alerts/escalation-rules', methods=['POST'])
+@app.route('/api/alerts/escalation-rules/<rule_id>', methods=['PUT'])
+@jwt_required()
+def save_escalation_rule(rule_id=None):
+    # Only administrators can change escalation rules
+    current_user = User.query.get(get_jwt_identity())
+    if current_user.role != 'administrator':
+        return create_response(success=False, error={'message': 'Insufficient permissions'})
+    
+    data = request.get_json() or {}
+    rule = EscalationRule.query.get_or_404(rule_id) if rule_id else None
+    try:
+        if rule is None:
+            missing = [field for field in ('name', 'minBalance', 'minAgeDays') if data.get(field) is None]
+            if missing:
+                raise ValueError(f"{', '.join(missing)} required")
+            rule = EscalationRule(id=str(uuid.uuid4()), cadence_days=30, priority='high', active=True)
+            db.session.add(rule)
+        rule.name = data.get('name', rule.name)
+        rule.min_balance = data.get('minBalance', rule.min_balance)
+        rule.max_balance = data.get('maxBalance', rule.max_balance)
+        rule.min_age_days = int(data.get('minAgeDays', rule.min_age_days))
+        rule.cadence_days = int(data.get('cadenceDays', rule.cadence_days))
+        rule.priority = data.get('priority', rule.priority)
+        rule.active = bool(data.get('active', rule.active))
+        if rule.cadence_days < 1:
+            raise ValueError('cadenceDays must be positive')
+        if rule.priority not in Alert.priority.type.enums:
+            raise ValueError(f"priority must be one of {', '.join(Alert.priority.type.enums)}")
+        if rule.max_balance is not None and float(rule.max_balance) <= float(rule.min_balance):
+            raise ValueError('maxBalance must be greater than minBalance')
+        db.session.commit()
+        return create_response(data=escalation_rule_data(rule))
+    except ValueError as e:
+        db.session.rollback()
+        return create_response(success=False, error={'message': f'Invalid escalation rule: {str(e)}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return create_response(success=False, error={'message': f'Failed to save escalation rule: {str(e)}'})
 
 # Users - Complete CRUD
 @app.route('/api/users', methods=['GET'])
@@ -261,63 +387,7 @@ def import_officers():
     if current_user.role != 'general_manager':
         return create_response(success=False, error={'message': 'Only general managers can import officers'})
     
-    try:
-        if 'file' not in request.files:
-            return create_response(success=False, error={'message': 'No file provided'})
-        
-        file = request.files['file']
-        from openpyxl import load_workbook
-        wb = load_workbook(file)
-        ws = wb.active
-        
-        imported_count = 0
-        errors = []
-        
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                if not row[0]:  # Skip empty rows
-                    continue
-                
-                username = str(row[0]).strip()
-                email = str(row[1]).strip()
-                password = str(row[2]).strip()
-                region_code = str(row[3]).strip() if row[3] else None
-                active = str(row[4]).strip().lower() in ['true', 'yes', '1'] if row[4] else True
-                
-                # Check if user already exists
-                existing = User.query.filter((User.username == username) | (User.email == email)).first()
-                if existing:
-                    errors.append(f"Row {row_idx}: User '{username}' or email '{email}' already exists")
-                    continue
-                
-                # Find region by code
-                region = None
-                if region_code:
-                    region = Region.query.filter_by(code=region_code).first()
-                    if not region:
-                        errors.append(f"Row {row_idx}: Region code '{region_code}' not found")
-                        continue
-                
-                user = User(
-                    id=str(uuid.uuid4()),
-                    username=username,
-                    email=email,
-                    role='collections_officer',
-                    region_id=region.id if region else None,
-                    active=active
-                )
-                user.set_password(password)
-                db.session.add(user)
-                imported_count += 1
-            except Exception as e:
-                errors.append(f"Row {row_idx}: {str(e)}")
-                continue
-        
-        db.session.commit()
-        return create_response(data={'imported': imported_count, 'errors': errors[:10]})
-    except Exception as e:
-        db.session.rollback()
-        return create_response(success=False, error={'message': f'Import failed: {str(e)}'})
+    return run_file_import('officer_import')
 
 # Regions
 @app.route('/api/regions', methods=['GET'])
@@ -438,46 +508,7 @@ def create_consumer():
 @app.route('/api/consumers/import', methods=['POST'])
 @jwt_required()
 def import_consumers():
-    try:
-        if 'file' not in request.files:
-            return create_response(success=False, error={'message': 'No file provided'})
-        
-        file = request.files['file']
-        from openpyxl import load_workbook
-        wb = load_workbook(file)
-        ws = wb.active
-        
-        imported_count = 0
-        errors = []
-        
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                if not row[0]:  # Skip empty rows
-                    continue
-                
-                consumer = Consumer(
-                    id=str(uuid.uuid4()),
-                    first_name=str(row[0]).strip(),
-                    last_name=str(row[1]).strip(),
-                    national_id=str(row[2]).strip() if row[2] else None,
-                    phone=str(row[3]).strip() if row[3] else None,
-                    email=str(row[4]).strip() if row[4] else None,
-                    address_street=str(row[5]).strip() if row[5] else None,
-                    address_city=str(row[6]).strip() if row[6] else None,
-                    address_county=str(row[7]).strip() if row[7] else None,
-                    region_id=str(row[8]).strip() if row[8] else None
-                )
-                db.session.add(consumer)
-                imported_count += 1
-            except Exception as e:
-                errors.append(f"Row {row_idx}: {str(e)}")
-                continue
-        
-        db.session.commit()
-        return create_response(data={'imported': imported_count, 'errors': errors[:10]})
-    except Exception as e:
-        db.session.rollback()
-        return create_response(success=False, error={'message': f'Import failed: {str(e)}'})
+    return run_file_import('consumer_import')
 
 @app.route('/api/consumers/<consumer_id>', methods=['PUT'])
 @jwt_required()
@@ -701,7 +732,9 @@ def get_accounts():
             'consumerPhone': a.consumer.phone if a.consumer else None,
             'consumerEmail': a.consumer.email if a.consumer else None,
             'officerName': a.assigned_officer.username if a.assigned_officer else None,
-            'placementDate': a.placement_date.isoformat() if a.placement_date else None
+            'placementDate': a.placement_date.isoformat() if a.placement_date else None,
+            'lastPaymentDate': a.last_payment_date.isoformat() if a.last_payment_date else None,
+            'lastPaymentAmount': float(a.last_payment_amount) if a.last_payment_amount is not None else None
         } for a in accounts.items],
         'total': accounts.total,
         'page': page,
@@ -738,65 +771,72 @@ def assign_account(account_id):
     
     return create_response(data={'message': 'Account assigned successfully'})
 
-@app.route('/api/accounts/import', methods=['POST'])
+@app.route('/api/accounts/bulk-assign', methods=['POST'])
 @jwt_required()
-def import_accounts():
+def bulk_assign_accounts():
+    """Reassign many accounts (by ID list or filter) to one officer or spread across several"""
+    current_user = User.query.get(get_jwt_identity())
+    if current_user.role not in ['collections_manager', 'general_manager', 'administrator']:
+        return create_response(success=False, error={'message': 'Insufficient permissions'})
+    
+    data = request.json or {}
+    officer_ids = data.get('officerIds') or ([data['officerId']] if data.get('officerId') else [])
+    if not officer_ids:
+        return create_response(success=False, error={'message': 'officerId or officerIds is required'})
+    if not data.get('accountIds') and not data.get('filter'):
+        return create_response(success=False, error={'message': 'accountIds or filter is required'})
+    if data.get('filter'):
+        try:
+            assignment_service.validate_filters(data['filter'])
+        except ValueError as e:
+            return create_response(success=False, error={'message': f'Invalid filter: {str(e)}'}), 400
+    
     try:
-        if 'file' not in request.files:
-            return create_response(success=False, error={'message': 'No file provided'})
-        
-        file = request.files['file']
-        from openpyxl import load_workbook
-        wb = load_workbook(file)
-        ws = wb.active
-        
-        imported_count = 0
-        errors = []
-        
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                if not row[0]:  # Skip empty rows
-                    continue
-                
-                consumer_id = str(row[0]).strip()
-                account_number = str(row[1]).strip()
-                original_balance = float(row[2])
-                current_balance = float(row[3])
-                principal_balance = float(row[4]) if row[4] else current_balance
-                interest_balance = float(row[5]) if row[5] else 0
-                fee_balance = float(row[6]) if row[6] else 0
-                creditor_id = str(row[7]).strip() if row[7] else None
-                
-                # Validate consumer exists
-                consumer = Consumer.query.get(consumer_id)
-                if not consumer:
-                    errors.append(f"Row {row_idx}: Consumer '{consumer_id}' not found")
-                    continue
-                
-                account = Account(
-                    id=str(uuid.uuid4()),
-                    consumer_id=consumer_id,
-                    account_number=account_number,
-                    original_balance=original_balance,
-                    current_balance=current_balance,
-                    principal_balance=principal_balance,
-                    interest_balance=interest_balance,
-                    fee_balance=fee_balance,
-                    creditor_id=creditor_id,
-                    placement_date=date.today(),
-                    status='active'
-                )
-                db.session.add(account)
-                imported_count += 1
-            except Exception as e:
-                errors.append(f"Row {row_idx}: {str(e)}")
-                continue
-        
+        result = assignment_service.reassign(
+            current_user, officer_ids,
+            account_ids=data.get('accountIds'),
+            filters=data.get('filter')
+        )
         db.session.commit()
-        return create_response(data={'imported': imported_count, 'errors': errors[:10]})
+        return create_response(data=result)
     except Exception as e:
         db.session.rollback()
-        return create_response(success=False, error={'message': f'Import failed: {str(e)}'})
+        return create_response(success=False, error={'message': f'Bulk assignment failed: {str(e)}'})
+
+@app.route('/api/accounts/auto-assign', methods=['POST'])
+@jwt_required()
+def auto_assign_accounts():
+    """Balance a region's unassigned (or an exiting officer's) accounts across its active officers"""
+    current_user = User.query.get(get_jwt_identity())
+    if current_user.role not in ['collections_manager', 'general_manager', 'administrator']:
+        return create_response(success=False, error={'message': 'Insufficient permissions'})
+    
+    data = request.json or {}
+    # Managers can only balance their own region
+    region_id = current_user.region_id if current_user.role == 'collections_manager' else data.get('regionId')
+    if not region_id:
+        return create_response(success=False, error={'message': 'regionId is required'})
+    
+    try:
+        result = assignment_service.auto_assign(
+            current_user, region_id,
+            account_ids=data.get('accountIds'),
+            from_officer_id=data.get('fromOfficerId'),
+            dry_run=bool(data.get('dryRun'))
+        )
+        if result['dryRun']:
+            db.session.rollback()
+        else:
+            db.session.commit()
+        return create_response(data=result)
+    except Exception as e:
+        db.session.rollback()
+        return create_response(success=False, error={'message': f'Auto-assignment failed: {str(e)}'})
+
+@app.route('/api/accounts/import', methods=['POST'])
+@jwt_required()
+def import_accounts():
+    return run_file_import('account_import')
 
 @app.route('/api/accounts/<account_id>', methods=['DELETE'])
 @jwt_required()
@@ -891,25 +931,33 @@ def get_payments():
 @jwt_required()
 def create_payment():
     data = request.json
+    if data.get('referenceNumber') and Payment.query.filter_by(reference_number=data['referenceNumber']).first():
+        return create_response(success=False, error={'message': 'A payment with this reference number already exists'})
+    
     payment = Payment(
         id=str(uuid.uuid4()),
         account_id=data['accountId'],
         amount=data['amount'],
         payment_method=data['paymentMethod'],
         reference_number=data.get('referenceNumber'),
-        created_by=get_jwt_identity()
+        created_by=get_jwt_identity(),
+        created_at=datetime.utcnow()
     )
     db.session.add(payment)
     
-    # Update account balance - convert to Decimal for proper arithmetic
+    # Update account balance and last payment rollup
     account = Account.query.get(data['accountId'])
     if account:
-        from decimal import Decimal
-        account.current_balance -= Decimal(str(data['amount']))
+        account.apply_payment(data['amount'], payment.created_at)
     
     db.session.commit()
     return create_response(data={'id': payment.id})
 
+@app.route('/api/payments/import', methods=['POST'])
+@jwt_required()
+def import_payments():
+    return run_file_import('payment_import')
+
 # Payment Schedules
 @app.route('/api/payment-schedules', methods=['GET'])
 @jwt_required()
@@ -962,77 +1010,7 @@ def create_payment_schedule():
 @app.route('/api/payment-schedules/import', methods=['POST'])
 @jwt_required()
 def import_payment_schedules():
-    try:
-        if 'file' not in request.files:
-            return create_response(success=False, error={'message': 'No file provided'})
-        
-        file = request.files['file']
-        if file.filename == '':
-            return create_response(success=False, error={'message': 'No file selected'})
-        
-        # Read Excel file
-        from openpyxl import load_workbook
-        wb = load_workbook(file)
-        ws = wb.active
-        
-        imported_count = 0
-        errors = []
-        
-        # Skip header row
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                if not row[0]:  # Skip empty rows
-                    continue
-                
-                account_id = str(row[0]).strip()
-                total_amount = float(row[1])
-                payment_amount = float(row[2])
-                frequency = str(row[3]).strip().lower()
-                start_date_str = str(row[4]).strip()
-                
-                # Parse date
-                try:
-                    start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                except:
-                    try:
-                        start_date = datetime.strptime(start_date_str, '%m/%d/%Y').date()
-                    except:
-                        errors.append(f"Row {row_idx}: Invalid date format '{start_date_str}'")
-                        continue
-                
-                # Validate account exists
-                account = Account.query.get(account_id)
-                if not account:
-                    errors.append(f"Row {row_idx}: Account '{account_id}' not found")
-                    continue
-                
-                # Create schedule
-                schedule = PaymentSchedule(
-                    id=str(uuid.uuid4()),
-                    account_id=account_id,
-                    total_amount=total_amount,
-                    payment_amount=payment_amount,
-                    frequency=frequency,
-                    start_date=start_date,
-                    created_by=get_jwt_identity()
-                )
-                db.session.add(schedule)
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {row_idx}: {str(e)}")
-                continue
-        
-        db.session.commit()
-        
-        return create_response(data={
-            'imported': imported_count,
-            'errors': errors[:10]  # Return first 10 errors
-        })
-        
-    except Exception as e:
-        db.session.rollback()
-        return create_response(success=False, error={'message': f'Import failed: {str(e)}'})
+    return run_file_import('payment_schedule_import')
 
 # Settlements
 @app.route('/api/settlements', methods=['GET'])
@@ -1087,55 +1065,7 @@ def create_settlement():
 @app.route('/api/settlements/import', methods=['POST'])
 @jwt_required()
 def import_settlements():
-    try:
-        if 'file' not in request.files:
-            return create_response(success=False, error={'message': 'No file provided'})
-        
-        file = request.files['file']
-        from openpyxl import load_workbook
-        wb = load_workbook(file)
-        ws = wb.active
-        
-        imported_count = 0
-        errors = []
-        
-        for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-            try:
-                if not row[0]:  # Skip empty rows
-                    continue
-                
-                account_id = str(row[0]).strip()
-                original_balance = float(row[1])
-                settlement_amount = float(row[2])
-                discount_percentage = float(row[3]) if row[3] else None
-                notes = str(row[4]).strip() if row[4] else None
-                
-                # Validate account exists
-                account = Account.query.get(account_id)
-                if not account:
-                    errors.append(f"Row {row_idx}: Account '{account_id}' not found")
-                    continue
-                
-                settlement = Settlement(
-                    id=str(uuid.uuid4()),
-                    account_id=account_id,
-                    original_balance=original_balance,
-                    settlement_amount=settlement_amount,
-                    discount_percentage=discount_percentage,
-                    notes=notes,
-                    created_by=get_jwt_identity()
-                )
-                db.session.add(settlement)
-                imported_count += 1
-            except Exception as e:
-                errors.append(f"Row {row_idx}: {str(e)}")
-                continue
-        
-        db.session.commit()
-        return create_response(data={'imported': imported_count, 'errors': errors[:10]})
-    except Exception as e:
-        db.session.rollback()
-        return create_response(success=False, error={'message': f'Import failed: {str(e)}'})
+    return run_file_import('settlement_import')
 
 @app.route('/api/settlements/<settlement_id>/approve', methods=['PUT'])
 @jwt_required()
@@ -1180,9 +1110,37 @@ def get_batch_jobs():
     return create_response(data=[{
         'id': j.id, 'filename': j.filename, 'jobType': j.job_type,
         'status': j.status, 'totalRecords': j.total_records,
-        'processedRecords': j.processed_records, 'createdAt': j.created_at.isoformat()
+        'processedRecords': j.processed_records, 'successRecords': j.success_records,
+        'failedRecords': j.failed_records, 'createdAt': j.created_at.isoformat(),
+        'completedAt': j.completed_at.isoformat() if j.completed_at else None
     } for j in jobs])
 
+@app.route('/api/batch-jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_batch_job(job_id):
+    job = BatchJob.query.get_or_404(job_id)
+    return create_response(data={
+        'id': job.id, 'filename': job.filename, 'jobType': job.job_type,
+        'status': job.status, 'totalRecords': job.total_records,
+        'processedRecords': job.processed_records, 'successRecords': job.success_records,
+        'failedRecords': job.failed_records, 'lastRow': job.last_row,
+        'errors': json.loads(job.error_log) if job.error_log else [],
+        'counts': json.loads(job.result_counts) if job.result_counts else {},
+        'createdAt': job.created_at.isoformat(),
+        'updatedAt': job.updated_at.isoformat() if job.updated_at else None,
+        'completedAt': job.completed_at.isoformat() if job.completed_at else None
+    })
+
+@app.route('/api/batch-jobs/<job_id>/resume', methods=['POST'])
+@jwt_required()
+def resume_batch_job(job_id):
+    job = BatchJob.query.get_or_404(job_id)
+    if not import_service.can_resume(job):
+        return create_response(success=False, error={'message': 'Job cannot be resumed'})
+    
+    import_service.submit(app, job.id)
+    return create_response(data={'jobId': job.id, 'resumeAfterRow': job.last_row, 'message': 'Import resumed'})
+
 @app.route('/api/batch-jobs', methods=['POST'])
 @jwt_required()
 def create_batch_job():
@@ -1241,32 +1199,61 @@ def assign_tag(entity_type, entity_id):
 def get_jobs():
     jobs = Job.query.all()
     return create_response(data=[{
-        'id': j.id, 'name': j.name, 'jobType': j.job_type,
-        'status': j.status, 'enabled': j.enabled, 'lastRun': j.last_run.isoformat() if j.last_run else None
+        'id': j.id, 'name': j.name, 'jobType': j.job_type, 'schedule': j.schedule,
+        'status': j.status, 'enabled': j.enabled, 'lastRun': j.last_run.isoformat() if j.last_run else None,
+        'nextRun': j.next_run.isoformat() if j.next_run else None
     } for j in jobs])
 
+@app.route('/api/jobs/<job_id>', methods=['PUT'])
+@jwt_required()
+def update_job(job_id):
+    # Only administrators can change job schedules
+    current_user = User.query.get(get_jwt_identity())
+    if current_user.role != 'administrator':
+        return create_response(success=False, error={'message': 'Insufficient permissions'})
+    
+    job = Job.query.get_or_404(job_id)
+    data = request.get_json() or {}
+    try:
+        if 'schedule' in data:
+            # Validate now and let the scheduler compute the next run from it
+            job.next_run = CronSchedule(data['schedule']).next_after(datetime.utcnow())
+            job.schedule = data['schedule']
+            if job.status == 'failed':
+                job.status = 'idle'
+        if 'enabled' in data:
+            job.enabled = bool(data['enabled'])
+        if 'config' in data:
+            job.config = json.dumps(data['config'])
+        db.session.commit()
+        return create_response(data={'id': job.id, 'schedule': job.schedule, 'enabled': job.enabled,
+                                     'nextRun': job.next_run.isoformat() if job.next_run else None})
+    except Exception as e:
+        db.session.rollback()
+        return create_response(success=False, error={'message': f'Failed to update job: {str(e)}'})
+
+@app.route('/api/jobs/<job_id>/executions', methods=['GET'])
+@jwt_required()
+def get_job_executions(job_id):
+    executions = JobExecution.query.filter_by(job_id=job_id).order_by(JobExecution.started_at.desc()).limit(50).all()
+    return create_response(data=[{
+        'id': e.id, 'status': e.status,
+        'startedAt': e.started_at.isoformat() if e.started_at else None,
+        'completedAt': e.completed_at.isoformat() if e.completed_at else None,
+        'durationSeconds': e.duration_seconds, 'rowsAffected': e.rows_affected,
+        'emailsSent': e.emails_sent, 'result': json.loads(e.result) if e.result else None
+    } for e in executions])
+
 @app.route('/api/jobs/<job_id>/execute', methods=['POST'])
 @jwt_required()
 def execute_job(job_id):
     job = Job.query.get_or_404(job_id)
-    execution = JobExecution(
-        id=str(uuid.uuid4()),
-        job_id=job_id,
-        status='running'
-    )
-    db.session.add(execution)
-    job.status = 'running'
-    job.last_run = datetime.utcnow()
-    db.session.commit()
+    if job.status == 'running':
+        return create_response(success=False, error={'message': 'Job is already running'})
     
-    # Simulate job execution
-    execution.status = 'completed'
-    execution.completed_at = datetime.utcnow()
-    execution.result = json.dumps({'message': 'Job completed successfully'})
-    job.status = 'completed'
-    db.session.commit()
-    
-    return create_response(data={'executionId': execution.id})
+    # Runs now, recording a JobExecution like a scheduled run
+    execution = job_scheduler.run_job(job.id)
+    return create_response(data={'executionId': execution.id, 'status': execution.status})
 
 # UDD Tables
 @app.route('/api/udd/tables', methods=['GET'])
@@ -2127,7 +2114,7 @@ def generate_manual_report():
             'executionId': execution.id,
             'reportData': report_data,
             'emailsSent': emails_sent,
-            'message': f'Report generated and sent to {emails_sent} recipients'
+            'message': f'Report generated and queued for {emails_sent} recipients'
         })
     
     return create_response(data={
@@ -2206,13 +2193,22 @@ def get_email_notifications():
             recipient_email=current_user.email
         ).order_by(EmailNotification.created_at.desc()).limit(50).all()
     
+    # Number of alerts summarised by each digest, in one grouped query
+    link = email_notification_alert.c
+    digest_sizes = dict(db.session.query(link.notification_id, db.func.count(link.alert_id)).filter(
+        link.notification_id.in_([n.id for n in notifications])
+    ).group_by(link.notification_id).all())
+    
     return create_response(data=[{
         'id': n.id, 'recipientEmail': n.recipient_email,
         'subject': n.subject, 'status': n.status,
         'sentAt': n.sent_at.isoformat() if n.sent_at else None,
         'createdAt': n.created_at.isoformat(),
         'reportExecutionId': n.report_execution_id,
-        'alertId': n.alert_id
+        'alertId': n.alert_id,
+        'alertCount': digest_sizes.get(n.id, 1 if n.alert_id else 0),
+        'attempts': n.attempts,
+        'lastError': n.last_error
     } for n in notifications])
 
 # Demand Letter System
@@ -2295,24 +2291,21 @@ def send_demand_letter_email(letter_id):
         return create_response(success=False, error={'message': 'No email address available'})
     
     try:
-        # Create email notification record
-        notification = EmailNotification(
-            id=str(uuid.uuid4()),
-            recipient_email=recipient_email,
-            subject=f"Payment Demand - Account {letter.account.account_number}",
-            body=letter.generated_content,
-            status='sent',
-            sent_at=datetime.utcnow()
+        # Queue the email in the outbox; the delivery worker sends it
+        notification = notification_outbox.queue(
+            recipient_email,
+            f"Payment Demand - Account {letter.account.account_number}",
+            letter.generated_content
         )
-        db.session.add(notification)
         
         # Update letter status
         letter.status = 'sent'
         
         db.session.commit()
         
-        return create_response(data={'message': f'Demand letter sent to {recipient_email}'})
+        return create_response(data={'message': f'Demand letter queued for {recipient_email}', 'notificationId': notification.id})
     except Exception as e:
+        db.session.rollback()
         return create_response(success=False, error={'message': f'Failed to send email: {str(e)}'})
 
 @app.route('/api/demand-letters/<letter_id>/pdf', methods=['GET'])
@@ -2743,7 +2736,9 @@ def get_npl_accounts():
         'currentBalance': float(a.current_balance),
         'status': a.status,
         'officerName': a.assigned_officer.username if a.assigned_officer else None,
-        'daysOutstanding': (now.date() - a.placement_date).days if a.placement_date else None
+        'daysOutstanding': (now.date() - a.placement_date).days if a.placement_date else None,
+        'lastPaymentDate': a.last_payment_date.isoformat() if a.last_payment_date else None,
+        'lastPaymentAmount': float(a.last_payment_amount) if a.last_payment_amount is not None else None
     } for a in npl_accounts])
 
 @app.route('/api/analytics/legal-cases', methods=['GET', 'OPTIONS'])
@@ -2848,31 +2843,40 @@ def upload_legal_cases():
     if current_user.role not in ['collections_manager', 'general_manager', 'administrator']:
         return create_response(success=False, error={'message': 'Insufficient permissions'})
     
-    data = request.json
+    # NDJSON bodies (one case per line) are streamed, upserted on caseNumber and committed per chunk
+    if request.mimetype in ['application/x-ndjson', 'application/ndjson']:
+        try:
+            importer = LegalCaseImporter(created_by=current_user.id)
+            result = importer.run(import_service.read_ndjson_lines(request.stream))
+            return create_response(data={
+                'imported': result['imported'],
+                'failed': result['failed'],
+                'counts': result['counts'],
+                'errors': result['errors']
+            })
+        except Exception as e:
+            db.session.rollback()
+            return create_response(success=False, error={'message': f'Error uploading legal cases: {str(e)}'})
+    
+    data = request.json or {}
     
     try:
-        for case_data in data.get('cases', []):
-            legal_case = LegalCase(
-                id=str(uuid.uuid4()),
-                account_id=case_data.get('accountId'),
-                case_number=case_data.get('caseNumber'),
-                case_type=case_data.get('caseType', 'court_case'),
-                status=case_data.get('status', 'pending'),
-                filed_date=datetime.strptime(case_data['filedDate'], '%Y-%m-%d').date() if case_data.get('filedDate') else None,
-                resolution_date=datetime.strptime(case_data['resolutionDate'], '%Y-%m-%d').date() if case_data.get('resolutionDate') else None,
-                recovery_amount=case_data.get('recoveryAmount', 0),
-                legal_costs=case_data.get('legalCosts', 0),
-                assigned_firm=case_data.get('assignedFirm'),
-                notes=case_data.get('notes'),
-                created_by=get_jwt_identity()
-            )
-            db.session.add(legal_case)
-        
-        db.session.commit()
-        return create_response(data={'message': f'{len(data.get("cases", []))} legal cases uploaded successfully'})
+        # Same upsert on caseNumber as NDJSON, so re-sent cases update instead of failing the batch
+        cases = data.get('cases', [])
+        importer = LegalCaseImporter(created_by=current_user.id)
+        importer.row_label = 'Case'
+        result = importer.run((i, (json.dumps(case_data),)) for i, case_data in enumerate(cases, 1))
+        return create_response(data={
+            'message': f'{result["imported"]} legal cases uploaded successfully',
+            'imported': result['imported'],
+            'failed': result['failed'],
+            'counts': result['counts'],
+            'errors': result['errors']
+        })
     except Exception as e:
         db.session.rollback()
         return create_response(success=False, error={'message': f'Error uploading legal cases: {str(e)}'})
+
 @app.route('/api/analytics/portfolio-at-risk/<bucket_label>/accounts', methods=['GET'])
 @jwt_required()
 def get_par_bucket_accounts(bucket_label):
@@ -3492,14 +3496,12 @@ def export_portfolio_at_risk_excel():
         else:
             risk_category = "Low Risk"
         
-        last_payment = Payment.query.filter_by(account_id=account.id, status='completed').order_by(Payment.created_at.desc()).first()
-        
         ws.cell(row=row, column=1, value=account.account_number)
         ws.cell(row=row, column=2, value=f"{account.consumer.first_name} {account.consumer.last_name}" if account.consumer else "N/A")
         ws.cell(row=row, column=3, value=float(account.current_balance))
         ws.cell(row=row, column=4, value=days_overdue)
         ws.cell(row=row, column=5, value=risk_category)
-        ws.cell(row=row, column=6, value=last_payment.created_at.strftime('%Y-%m-%d') if last_payment else "No payments")
+        ws.cell(row=row, column=6, value=account.last_payment_date.strftime('%Y-%m-%d') if account.last_payment_date else "No payments")
         ws.cell(row=row, column=7, value=account.assigned_officer.username if account.assigned_officer else "N/A")
     
     for column in ws.columns:
@@ -3807,13 +3809,12 @@ def export_comprehensive_report():
     
     for account in npl_accounts[:200]:  # Limit to 200 NPL accounts
         days_overdue = (datetime.now().date() - account.placement_date).days if account.placement_date else 0
-        last_payment = Payment.query.filter_by(account_id=account.id, status='completed').order_by(Payment.created_at.desc()).first()
         ws_npl.append([
             account.account_number,
             f"{account.consumer.first_name} {account.consumer.last_name}" if account.consumer else 'N/A',
             float(account.current_balance),
             days_overdue,
-            last_payment.created_at.strftime('%Y-%m-%d') if last_payment else 'No payments',
+            account.last_payment_date.strftime('%Y-%m-%d') if account.last_payment_date else 'No payments',
             account.assigned_officer.username if account.assigned_officer else 'Unassigned'
         ])
     
@@ -3834,6 +3835,16 @@ def export_comprehensive_report():
     filename = f'comprehensive_report_{start_date}_{end_date}.xlsx'
     return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                     as_attachment=True, download_name=filename)
+
+
+@app.cli.command('rebuild-alert-counters')
+def rebuild_alert_counters_command():
+    """Recount the alert badge counters from the alert table; run once at deploy"""
+    alert_service.rebuild_alert_counters()
+    db.session.commit()
+    print(f"Alert counters rebuilt: {AlertCounter.query.count()} scopes")
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
 
@@ -4546,14 +4557,13 @@ def export_npl_analysis_excel():
     
     for row, account in enumerate(npl_accounts, 2):
         days_overdue = (now.date() - account.placement_date).days if account.placement_date else 0
-        last_payment = Payment.query.filter_by(account_id=account.id, status='completed').order_by(Payment.created_at.desc()).first()
         
         ws.cell(row=row, column=1, value=account.account_number)
         ws.cell(row=row, column=2, value=f"{account.consumer.first_name} {account.consumer.last_name}" if account.consumer else 'N/A')
         ws.cell(row=row, column=3, value=float(account.current_balance))
         ws.cell(row=row, column=4, value=days_overdue)
         ws.cell(row=row, column=5, value='Non-Performing Loan')
-        ws.cell(row=row, column=6, value=last_payment.created_at.strftime('%Y-%m-%d') if last_payment else 'No payments')
+        ws.cell(row=row, column=6, value=account.last_payment_date.strftime('%Y-%m-%d') if account.last_payment_date else 'No payments')
         ws.cell(row=row, column=7, value=account.assigned_officer.username if account.assigned_officer else 'Unassigned')
     
     for column in ws.columns:
@@ -0,0 +1,266 @@
+import math
+import heapq
+import uuid
+from datetime import datetime
+from models import db, Account, AREvent, Consumer, User
+
+ACCOUNT_FILTERS = ('officerId', 'unassigned', 'status', 'creditorId', 'regionId')  # Keys select_accounts understands
+UPDATE_CHUNK = 5000  # Account ids per reassignment UPDATE, within database bind parameter limits
+
+
+def _fill_level(values, extra):
+    """Level the lowest values can all be raised to by sharing out extra (water-filling)"""
+    values = sorted(values)
+    filled = 0
+    for i, value in enumerate(values):
+        filled += value
+        level = (extra + filled) / (i + 1)
+        if i + 1 == len(values) or level <= values[i + 1]:
+            return level
+
+
+class AssignmentService:
+    """Set-based account (re)assignment, enforcing the manager-region rule in SQL"""
+
+    def region_officers(self, region_id):
+        return db.select(User.id).where(
+            User.region_id == region_id,
+            User.role == 'collections_officer'
+        )
+
+    def account_scope(self, user):
+        """Accounts a user may reassign: managers are limited to their region's book"""
+        if user.role != 'collections_manager':
+            return db.true()
+        return db.or_(
+            Account.assigned_officer_id.in_(self.region_officers(user.region_id)),
+            db.and_(
+                Account.assigned_officer_id.is_(None),
+                Account.consumer_id.in_(db.select(Consumer.id).where(Consumer.region_id == user.region_id))
+            )
+        )
+
+    def target_scope(self, user, officer_id):
+        """Target officers must be active officers, in the manager's region for managers"""
+        officers = db.select(User.id).where(
+            User.id == officer_id,
+            User.role == 'collections_officer',
+            User.active.is_(True)
+        )
+        if user.role == 'collections_manager':
+            officers = officers.where(User.region_id == user.region_id)
+        return db.exists(officers)
+
+    def eligible_officers(self, user, officer_ids):
+        """{officer_id: username} for the requested officers the user may assign to"""
+        query = db.session.query(User.id, User.username).filter(
+            User.id.in_(officer_ids),
+            User.role == 'collections_officer',
+            User.active.is_(True)
+        )
+        if user.role == 'collections_manager':
+            query = query.filter(User.region_id == user.region_id)
+        return dict(query.all())
+
+    def validate_filters(self, filters):
+        """Reject filters that would silently select everything: unknown keys, or no usable criteria"""
+        if not isinstance(filters, dict):
+            raise ValueError('filter must be an object')
+        unknown = sorted(set(filters) - set(ACCOUNT_FILTERS))
+        if unknown:
+            raise ValueError(f"Unknown filter keys: {', '.join(unknown)}; supported: {', '.join(ACCOUNT_FILTERS)}")
+        if not any(filters.get(key) for key in ACCOUNT_FILTERS):
+            raise ValueError('filter has no criteria')
+
+    def select_accounts(self, user, account_ids=None, filters=None):
+        """(account id, current officer id, current officer username) rows within the user's scope"""
+        if filters:
+            self.validate_filters(filters)
+        query = db.session.query(Account.id, Account.assigned_officer_id, User.username).outerjoin(
+            User, User.id == Account.assigned_officer_id
+        ).filter(self.account_scope(user))
+
+        if account_ids is not None:
+            query = query.filter(Account.id.in_(account_ids))
+        filters = filters or {}
+        if filters.get('officerId'):
+            query = query.filter(Account.assigned_officer_id == filters['officerId'])
+        if filters.get('unassigned'):
+            query = query.filter(Account.assigned_officer_id.is_(None))
+        if filters.get('status'):
+            query = query.filter(Account.status == filters['status'])
+        if filters.get('creditorId'):
+            query = query.filter(Account.creditor_id == filters['creditorId'])
+        if filters.get('regionId'):
+            query = query.filter(Account.consumer_id.in_(
+                db.select(Consumer.id).where(Consumer.region_id == filters['regionId'])
+            ))
+        return query.order_by(Account.id).all()
+
+    def apply_plan(self, user, plan, officers, action='reassigned'):
+        """Apply [(account_id, old_officer_id, old_username, new_officer_id)] as one UPDATE per target officer plus one event insert.
+
+        Each UPDATE re-checks the account and target scopes in its WHERE clause, so a plan
+        that strays outside the user's region (or went stale) rolls back instead of applying.
+        Callers commit.
+        """
+        if not plan:
+            return 0
+
+        by_officer = {}
+        for account_id, _, _, new_id in plan:
+            by_officer.setdefault(new_id, []).append(account_id)
+
+        account = Account.__table__
+        updated = 0
+        for officer_id, account_ids in by_officer.items():
+            target_ok = self.target_scope(user, officer_id)
+            for start in range(0, len(account_ids), UPDATE_CHUNK):
+                updated += db.session.execute(account.update().where(
+                    account.c.id.in_(account_ids[start:start + UPDATE_CHUNK]),
+                    self.account_scope(user),
+                    target_ok
+                ).values(assigned_officer_id=officer_id)).rowcount
+        if updated != len(plan):
+            raise ValueError('Some accounts or officers are outside your region or changed during reassignment')
+
+        now = datetime.utcnow()
+        db.session.execute(AREvent.__table__.insert(), [{
+            'id': str(uuid.uuid4()),
+            'account_id': account_id,
+            'event_type': 'account_reassignment',
+            'description': f'Account {action} from {old_username or "unassigned"} to {officers[new_id]}',
+            'created_by': user.id,
+            'created_at': now
+        } for account_id, _, old_username, new_id in plan])
+        return updated
+
+    def officer_loads(self, region_id, exclude=None):
+        """{officer_id: [username, account count, total current balance]} for a region's active officers"""
+        loads = {
+            officer_id: [username, 0, 0.0]
+            for officer_id, username in db.session.query(User.id, User.username).filter(
+                User.region_id == region_id,
+                User.role == 'collections_officer',
+                User.active.is_(True)
+            )
+            if officer_id != exclude
+        }
+        for officer_id, count, balance in db.session.query(
+            Account.assigned_officer_id, db.func.count(Account.id), db.func.sum(Account.current_balance)
+        ).filter(
+            Account.assigned_officer_id.in_(list(loads)),
+            Account.status == 'active'
+        ).group_by(Account.assigned_officer_id):
+            loads[officer_id][1:] = [count, float(balance or 0)]
+        return loads
+
+    def balance_plan(self, loads, accounts):
+        """Greedily place accounts, largest balance first, on the officer needing the most balance per open slot.
+
+        Targets are water-filled: each officer may grow to a common account count (the cap)
+        and a common balance level, ignoring officers already above them. An officer's
+        priority is its remaining balance gap divided by its remaining slots, kept in a heap
+        so each placement is O(log officers). Returns {account_id: officer_id}.
+        """
+        if not loads or not accounts:
+            return {}
+        accounts = sorted(accounts, key=lambda account: account[1], reverse=True)
+        cap = math.ceil(_fill_level([load[1] for load in loads.values()], len(accounts)))
+        balance_target = _fill_level([load[2] for load in loads.values()], sum(balance for _, balance in accounts))
+
+        heap = [
+            (-(balance_target - balance) / (cap - count), officer_id, count, balance)
+            for officer_id, (_, count, balance) in loads.items()
+            if count < cap
+        ]
+        heapq.heapify(heap)
+        plan = {}
+        for account_id, balance in accounts:
+            _, officer_id, count, total = heap[0]
+            count, total = count + 1, total + balance
+            plan[account_id] = officer_id
+            if count >= cap:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (-(balance_target - total) / (cap - count), officer_id, count, total))
+        return plan
+
+    def auto_assign(self, user, region_id, account_ids=None, from_officer_id=None, dry_run=False):
+        """Spread a region's unassigned accounts (or a given/exiting officer's book) across its officers"""
+        loads = self.officer_loads(region_id, exclude=from_officer_id)
+        if not loads:
+            raise ValueError('No active officers in this region')
+
+        query = db.session.query(
+            Account.id, Account.current_balance, Account.assigned_officer_id, User.username
+        ).outerjoin(User, User.id == Account.assigned_officer_id).filter(
+            self.account_scope(user),
+            Account.consumer_id.in_(db.select(Consumer.id).where(Consumer.region_id == region_id)),
+            Account.status == 'active'
+        )
+        if account_ids is not None:
+            query = query.filter(Account.id.in_(account_ids))
+        elif from_officer_id:
+            query = query.filter(Account.assigned_officer_id == from_officer_id)
+        else:
+            query = query.filter(Account.assigned_officer_id.is_(None))
+        rows = query.all()
+
+        # Accounts being moved no longer count towards their current officer's load
+        for _, balance, old_id, _ in rows:
+            if old_id in loads:
+                loads[old_id][1] -= 1
+                loads[old_id][2] -= float(balance or 0)
+
+        assignments = self.balance_plan(loads, [(account_id, float(balance or 0)) for account_id, balance, _, _ in rows])
+        summary = {
+            officer_id: {'username': username, 'accountsBefore': count, 'balanceBefore': round(balance, 2),
+                         'accountsAdded': 0, 'balanceAdded': 0.0}
+            for officer_id, (username, count, balance) in loads.items()
+        }
+        plan = []
+        for account_id, balance, old_id, old_username in rows:
+            new_id = assignments[account_id]
+            summary[new_id]['accountsAdded'] += 1
+            summary[new_id]['balanceAdded'] += float(balance or 0)
+            if new_id != old_id:
+                plan.append((account_id, old_id, old_username, new_id))
+        for officer in summary.values():
+            officer['balanceAdded'] = round(officer['balanceAdded'], 2)
+            officer['accountsAfter'] = officer['accountsBefore'] + officer['accountsAdded']
+            officer['balanceAfter'] = round(officer['balanceBefore'] + officer['balanceAdded'], 2)
+
+        officers = {officer_id: load[0] for officer_id, load in loads.items()}
+        assigned = 0 if dry_run else self.apply_plan(user, plan, officers, action='auto-assigned')
+        return {'dryRun': dry_run, 'accounts': len(rows), 'assigned': assigned, 'officers': summary}
+
+    def reassign(self, user, officer_ids, account_ids=None, filters=None):
+        """Move the selected accounts to one officer, or spread them round-robin across several"""
+        officer_ids = list(dict.fromkeys(officer_ids))
+        officers = self.eligible_officers(user, officer_ids)
+        missing = [officer_id for officer_id in officer_ids if officer_id not in officers]
+        if missing:
+            raise ValueError(f"Officers not found or outside your region: {', '.join(missing)}")
+
+        rows = self.select_accounts(user, account_ids, filters)
+        plan = []
+        skipped = 0
+        for i, (account_id, old_id, old_username) in enumerate(rows):
+            new_id = officer_ids[i % len(officer_ids)]
+            if old_id == new_id:
+                skipped += 1
+                continue
+            plan.append((account_id, old_id, old_username, new_id))
+
+        reassigned = self.apply_plan(user, plan, officers)
+        by_officer = {officer_id: 0 for officer_id in officer_ids}
+        for _, _, _, new_id in plan:
+            by_officer[new_id] += 1
+        result = {'reassigned': reassigned, 'unchanged': skipped, 'byOfficer': by_officer}
+        if account_ids is not None:
+            result['notFound'] = len(set(account_ids)) - len(rows)  # Unknown or outside the user's region
+        return result
+
+
+assignment_service = AssignmentService()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+PASSWORD HASHING BENCHMARK
+Compares serial hashing with the process pool used by bulk officer imports.
+Usage: python benchmark_password_hashing.py [passwords]
+"""
+
+import os
+import sys
+import time
+from werkzeug.security import check_password_hash, generate_password_hash
+from password_hashing import hash_passwords
+
+
+def benchmark(count):
+    passwords = [f'officer{i}' for i in range(count)]
+    cores = os.cpu_count() or 1
+
+    start = time.perf_counter()
+    for password in passwords:
+        generate_password_hash(password)
+    serial = time.perf_counter() - start
+    print(f"Hashing {count} passwords on {cores} core(s)")
+    print(f"  serial      {serial:7.2f}s  {count / serial:6.1f} hashes/s")
+
+    workers = 2
+    while True:
+        workers = min(workers, cores)
+        hash_passwords(passwords[:workers], workers=workers)  # Start the pool outside the timing
+        start = time.perf_counter()
+        hashes = hash_passwords(passwords, workers=workers)
+        elapsed = time.perf_counter() - start
+        speedup = serial / elapsed
+        print(f"  {workers:2d} workers  {elapsed:7.2f}s  {count / elapsed:6.1f} hashes/s  "
+              f"speedup {speedup:4.1f}x  efficiency {speedup / workers:4.0%}")
+
+        # Hashes must come back in input order
+        assert all(check_password_hash(h, p) for h, p in zip(hashes[:5] + hashes[-5:], passwords[:5] + passwords[-5:]))
+        if workers >= cores:
+            break
+        workers *= 2
+
+    if cores == 1:
+        print("  single core host: hash_passwords hashes in-process, no pool to compare")
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 64)
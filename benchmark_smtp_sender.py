@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+SMTP SENDER BENCHMARK
+Compares a connection per email, one reused connection and the pooled sender against a
+local SMTP stand-in that answers each command after a simulated network round trip.
+Usage: python benchmark_smtp_sender.py [emails] [latency_ms]
+"""
+
+import sys
+import time
+import threading
+import socketserver
+from email_service import EmailService
+from smtp_sender import DomainRateLimiter, PooledSMTPSender
+
+
+class SMTPStandIn:
+    """Minimal threaded SMTP server that accepts AUTH and counts messages"""
+
+    def __init__(self, latency):
+        stand_in = self
+        self.messages = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                time.sleep(latency)
+                self.wfile.write((line + '\r\n').encode())
+
+            def handle(self):
+                with stand_in.lock:
+                    stand_in.connections += 1
+                self.reply('220 stand-in ready')
+                while True:
+                    line = self.rfile.readline().decode().strip()
+                    if not line:
+                        return
+                    command = line.split(' ')[0].upper()
+                    if command == 'EHLO':
+                        self.wfile.write(b'250-stand-in\r\n')
+                        self.reply('250 AUTH PLAIN LOGIN')
+                    elif command == 'AUTH':
+                        self.reply('235 authenticated')
+                    elif command == 'DATA':
+                        self.reply('354 end with .')
+                        while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                            pass
+                        with stand_in.lock:
+                            stand_in.messages += 1
+                        self.reply('250 queued')
+                    elif command == 'QUIT':
+                        self.reply('221 bye')
+                        return
+                    else:
+                        self.reply('250 ok')
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def messages(count):
+    return [(i, f'officer{i}@example{i % 5}.com', f'Alert {i}', f'<p>Payment due on account {i}</p>')
+            for i in range(count)]
+
+
+def report(label, count, elapsed, baseline=None):
+    line = f"  {label:<22} {elapsed:7.2f}s  {count / elapsed:7.1f} emails/s"
+    if baseline:
+        line += f"  speedup {baseline / elapsed:5.1f}x"
+    print(line)
+
+
+def benchmark(count, latency_ms):
+    stand_in = SMTPStandIn(latency_ms / 1000.0)
+    service = EmailService(smtp_server='127.0.0.1', smtp_port=stand_in.port, use_tls=False, deliver=True)
+    batch = messages(count)
+    print(f"Sending {count} emails, {latency_ms}ms per SMTP reply")
+
+    start = time.perf_counter()
+    for _, to_email, subject, body in batch:
+        connection = service.connect()
+        service.deliver_message(connection, to_email, subject, body)
+        service.disconnect(connection)
+    per_email = time.perf_counter() - start
+    report('connection per email', count, per_email)
+
+    start = time.perf_counter()
+    connection = service.connect()
+    for _, to_email, subject, body in batch:
+        service.deliver_message(connection, to_email, subject, body)
+    service.disconnect(connection)
+    reused = time.perf_counter() - start
+    report('one connection', count, reused, per_email)
+
+    for pool_size in (2, 4, 8):
+        sender = PooledSMTPSender(service, pool_size, DomainRateLimiter(per_minute=0))  # Unlimited
+        start = time.perf_counter()
+        results = sender.send_many(batch)
+        elapsed = time.perf_counter() - start
+        sender.close()
+        assert not any(results.values()), [e for e in results.values() if e][:1]
+        report(f'pool of {pool_size}', count, elapsed, per_email)
+
+    expected = count * 5
+    assert stand_in.messages == expected, (stand_in.messages, expected)
+    print(f"  {stand_in.connections} connections opened in total")
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+              int(sys.argv[2]) if len(sys.argv) > 2 else 5)
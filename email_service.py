@@ -2,34 +2,64 @@ import smtplib
 import json
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, date
-from models import db, EmailNotification, User, ReportExecution
-import uuid
+from models import db, User, ReportExecution
 
 class EmailService:
-    def __init__(self, smtp_server='smtp.gmail.com', smtp_port=587, username=None, password=None):
+    def __init__(self, smtp_server='smtp.gmail.com', smtp_port=587, username=None, password=None,
+                 use_tls=True, deliver=False):
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.username = username or 'collections@company.com'
         self.password = password or 'app_password'
+        self.use_tls = use_tls
+        self.deliver = deliver  # False logs emails instead of sending them (demo mode)
     
-    def send_email(self, to_email, subject, body, is_html=True):
+    def connect(self):
+        """Open an SMTP connection to reuse for a batch of messages, or None in demo mode"""
+        if not self.deliver:
+            return None
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=30)
+        if self.use_tls:
+            server.starttls()
+        server.ehlo_or_helo_if_needed()
+        if server.has_extn('auth'):
+            server.login(self.username, self.password)
+        return server
+    
+    def disconnect(self, connection):
+        if connection is None:
+            return
         try:
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.username
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            if is_html:
-                msg.attach(MIMEText(body, 'html'))
-            else:
-                msg.attach(MIMEText(body, 'plain'))
-            
+            connection.quit()
+        except Exception:
+            connection.close()
+    
+    def build_message(self, to_email, subject, body, is_html=True):
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.username
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'html' if is_html else 'plain'))
+        return msg
+    
+    def deliver_message(self, connection, to_email, subject, body, is_html=True):
+        """Send one message over an open connection, raising on failure"""
+        msg = self.build_message(to_email, subject, body, is_html)
+        if connection is None:
             # For demo purposes, we'll just log the email
             print(f"EMAIL SENT TO: {to_email}")
             print(f"SUBJECT: {subject}")
             print(f"BODY: {body[:200]}...")
-            
+            return
+        connection.sendmail(self.username, [to_email], msg.as_string())
+    
+    def send_email(self, to_email, subject, body, is_html=True):
+        try:
+            connection = self.connect()
+            try:
+                self.deliver_message(connection, to_email, subject, body, is_html)
+            finally:
+                self.disconnect(connection)
             return True
         except Exception as e:
             print(f"Email send failed: {str(e)}")
@@ -48,31 +78,17 @@ class EmailService:
         subject = f"{template.name} - {execution.report_date.strftime('%B %d, %Y')}"
         body = self.generate_report_html(report_data, template.name, execution.report_date)
         
-        success_count = 0
+        # Queue one notification per recipient; the outbox worker delivers them
+        from notification_outbox import notification_outbox
+        queued = 0
         for user_id in recipients:
             user = User.query.get(user_id)
             if user and user.email:
-                # Create email notification record
-                notification = EmailNotification(
-                    id=str(uuid.uuid4()),
-                    recipient_email=user.email,
-                    subject=subject,
-                    body=body,
-                    report_execution_id=report_execution_id,
-                    status='pending'
-                )
-                db.session.add(notification)
-                
-                # Send email
-                if self.send_email(user.email, subject, body):
-                    notification.status = 'sent'
-                    notification.sent_at = datetime.utcnow()
-                    success_count += 1
-                else:
-                    notification.status = 'failed'
+                notification_outbox.queue(user.email, subject, body, report_execution_id=report_execution_id)
+                queued += 1
         
         db.session.commit()
-        return success_count
+        return queued
     
     def generate_report_html(self, report_data, report_name, report_date):
         html = f"""
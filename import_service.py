@@ -0,0 +1,818 @@
+import io
+import os
+import csv
+import gzip
+import hashlib
+import json
+import itertools
+import uuid
+from decimal import Decimal
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, timedelta, timezone
+from openpyxl import load_workbook
+from password_hashing import hash_passwords
+from models import db, conflict_insert, User, Region, Consumer, Creditor, Account, Payment, Settlement, PaymentSchedule, LegalCase, BatchJob
+
+CHUNK_SIZE = 5000
+MAX_ERRORS = 100  # Per-row error messages kept on the job
+IMPORT_WORKERS = 2
+STALE_JOB_AFTER = timedelta(minutes=10)  # Processing jobs without a heartbeat this long are resumed
+GZIP_MAGIC = b'\x1f\x8b'
+ZIP_MAGIC = b'PK\x03\x04'  # .xlsx workbooks are zip archives
+JOB_FAILED = 'Import failed: '  # Prefix of the job-level error logged when a run crashes
+
+
+def _text(value):
+    """Return a stripped string for a cell, or None for blank cells"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _amount(value, default=None):
+    """Parse a numeric cell, falling back to default for blank cells"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if default is None:
+            raise ValueError('Amount is required')
+        return default
+    return float(value)
+
+
+def _date(value):
+    """Parse a date cell given as a date/datetime or a YYYY-MM-DD / MM/DD/YYYY string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = _text(value)
+    for fmt in ('%Y-%m-%d', '%m/%d/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except (TypeError, ValueError):
+            continue
+    raise ValueError(f"Invalid date format '{value}'")
+
+
+def _datetime(value):
+    """Parse a timestamp cell (ISO or MM/DD/YYYY, with or without a time), keeping the time of day"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    value = _text(value)
+    try:
+        parsed = datetime.fromisoformat(value)
+        return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+    except (TypeError, ValueError):
+        pass
+    for fmt in ('%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M', '%m/%d/%Y'):
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            continue
+    raise ValueError(f"Invalid date format '{value}'")
+
+
+def processed_rows(result):
+    """Rows an import has read so far: each was imported, rejected, or skipped as a duplicate"""
+    return result['imported'] + result['failed'] + result.get('skipped', 0)
+
+
+def upsert(table, key_columns, update_columns):
+    """INSERT ... ON CONFLICT (key_columns) DO UPDATE for the bound database's dialect"""
+    stmt = conflict_insert(table)
+    set_ = {column: stmt.excluded[column] for column in update_columns}
+    # DO UPDATE skips Python-side onupdate values (e.g. updated_at); take the new row's default instead
+    for column in table.c:
+        if column.onupdate is not None and column.default is not None:
+            set_.setdefault(column.name, stmt.excluded[column.name])
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c[column] for column in key_columns],
+        set_=set_
+    )
+
+
+class BaseImporter:
+    """Parses, validates and bulk inserts one kind of import file, a chunk at a time"""
+    model = None
+    columns = 0
+    row_label = 'Row'  # How errors refer to a source row
+
+    def __init__(self, created_by=None, chunk_size=CHUNK_SIZE):
+        self.created_by = created_by
+        self.chunk_size = chunk_size
+
+    def preload(self):
+        """Load small lookup dimensions once per import"""
+        pass
+
+    def parse_row(self, row):
+        """Turn a row tuple into a column dict, raising ValueError for bad rows"""
+        raise NotImplementedError
+
+    def validate_chunk(self, records):
+        """Chunk-level validation hook; returns {row_idx: error message} for rejected rows"""
+        return {}
+
+    def prepare_chunk(self, records):
+        """Finish records that passed validation, just before they are inserted"""
+        pass
+
+    def existing_ids(self, model, ids):
+        """Return which of the given ids exist in model's table, using one IN query"""
+        ids = set(ids)
+        if not ids:
+            return set()
+        return {row[0] for row in db.session.query(model.id).filter(model.id.in_(ids))}
+
+    def reject_missing(self, records, model, field, label, rejected=None):
+        """Reject records whose field does not reference an existing row of model"""
+        rejected = {} if rejected is None else rejected
+        found = self.existing_ids(model, (record[field] for _, record in records))
+        for row_idx, record in records:
+            if row_idx not in rejected and record[field] not in found:
+                rejected[row_idx] = f"{label} '{record[field]}' not found"
+        return rejected
+
+    def insert_chunk(self, records):
+        """Insert validated records with a single executemany Core insert.
+
+        Importers that upsert return a dict of counts (e.g. inserted/updated) to add
+        to the job's result_counts; plain inserts return None.
+        """
+        db.session.execute(self.model.__table__.insert(), records)
+
+    def run(self, rows, result=None, checkpoint=None):
+        """Import (row_idx, row) pairs, committing each chunk on its own.
+
+        checkpoint(result, last_row) is called inside every chunk's transaction so
+        progress is committed atomically with the rows it describes.
+        """
+        result = result or {'imported': 0, 'failed': 0, 'errors': []}
+        result.setdefault('skipped', 0)
+        result.setdefault('counts', {})
+        self.checkpoint = checkpoint
+        self.preload()
+        chunk = []
+        for row_idx, row in rows:
+            if not row or not row[0]:  # Skip empty rows
+                continue
+            chunk.append((row_idx, row))
+            if len(chunk) >= self.chunk_size:
+                self.process_chunk(chunk, result)
+                chunk = []
+        if chunk:
+            self.process_chunk(chunk, result)
+        return result
+
+    def process_chunk(self, chunk, result):
+        """Parse, validate, insert and commit one chunk, recording per-row errors"""
+        last_row = chunk[-1][0]
+        parsed = []
+        rejected = {}
+        for row_idx, row in chunk:
+            if len(row) < self.columns:
+                row = tuple(row) + (None,) * (self.columns - len(row))
+            try:
+                parsed.append((row_idx, self.parse_row(row)))
+            except Exception as e:
+                rejected[row_idx] = e
+
+        if parsed:
+            rejected.update(self.validate_chunk(parsed))
+        records = [(row_idx, record) for row_idx, record in parsed if row_idx not in rejected]
+        if records:
+            self.prepare_chunk(records)
+        # Rejected rows are recorded with the checkpoint that passes them, so a resume never counts them twice
+        rejected = sorted(rejected.items())
+
+        try:
+            counts = self.insert_chunk([record for _, record in records]) if records else None
+            self.commit(result, last_row, imported=self.imported(records, counts), counts=counts, errors=rejected)
+        except Exception:
+            db.session.rollback()
+            # Fall back to row-by-row inserts to isolate the offending rows
+            for row_idx, record in records:
+                earlier = [error for error in rejected if error[0] < row_idx]
+                rejected = rejected[len(earlier):]
+                try:
+                    counts = self.insert_chunk([record])
+                    self.commit(result, row_idx, imported=self.imported([record], counts), counts=counts, errors=earlier)
+                except Exception as e:
+                    db.session.rollback()
+                    rejected = earlier + [(row_idx, e)] + rejected
+            self.commit(result, last_row, errors=rejected)
+
+    def imported(self, records, counts):
+        """Rows a chunk actually stored; rows insert_chunk skipped as duplicates count as skipped instead"""
+        return len(records) - (counts or {}).get('duplicates', 0)
+
+    def commit(self, result, last_row, imported=0, counts=None, errors=()):
+        """Commit the current transaction together with the progress checkpoint and the rows it rejected"""
+        counts = counts or {}
+        failed, logged = result['failed'], len(result['errors'])
+        skipped = counts.get('duplicates', 0)
+        for row_idx, error in errors:
+            self._add_error(result, row_idx, error)
+        result['imported'] += imported
+        result['skipped'] += skipped
+        for key, value in counts.items():
+            result['counts'][key] = result['counts'].get(key, 0) + value
+        try:
+            if self.checkpoint:
+                self.checkpoint(result, last_row)
+            db.session.commit()
+        except Exception:
+            result['imported'] -= imported
+            result['skipped'] -= skipped
+            for key, value in counts.items():
+                result['counts'][key] -= value
+            result['failed'] = failed
+            del result['errors'][logged:]
+            raise
+
+    def _add_error(self, result, row_idx, error):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_ERRORS:
+            result['errors'].append(f"{self.row_label} {row_idx}: {str(error)}")
+
+
+class ConsumerImporter(BaseImporter):
+    model = Consumer
+    columns = 9
+
+    def parse_row(self, row):
+        last_name = _text(row[1])
+        if not last_name:
+            raise ValueError('Last name is required')
+
+        now = datetime.utcnow()
+        return {
+            'id': str(uuid.uuid4()),
+            'first_name': str(row[0]).strip(),
+            'last_name': last_name,
+            'national_id': _text(row[2]),
+            'phone': _text(row[3]),
+            'email': _text(row[4]),
+            'address_street': _text(row[5]),
+            'address_city': _text(row[6]),
+            'address_county': _text(row[7]),
+            'region_id': _text(row[8]),
+            'created_at': now,
+            'updated_at': now
+        }
+
+
+class AccountImporter(BaseImporter):
+    """Upserts placement files keyed on (creditor_id, account_number), so creditors can resend them"""
+    model = Account
+    columns = 8
+    # Columns a resent placement file may change on an existing account
+    update_columns = ('consumer_id', 'original_balance', 'current_balance', 'principal_balance',
+                      'interest_balance', 'fee_balance', 'import_hash')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = set()  # (creditor_id, account_number) keys already accepted from this file
+
+    def preload(self):
+        self.creditor_ids = {row[0] for row in db.session.query(Creditor.id)}
+
+    def validate_chunk(self, records):
+        return self.reject_missing(records, Consumer, 'consumer_id', 'Consumer')
+
+    def parse_row(self, row):
+        consumer_id = str(row[0]).strip()
+        account_number = _text(row[1])
+        current_balance = _amount(row[3])
+        creditor_id = _text(row[7])
+        if not account_number or not creditor_id:
+            raise ValueError('Account number and creditor ID are required')
+        if creditor_id not in self.creditor_ids:
+            raise ValueError(f"Creditor '{creditor_id}' not found")
+        if (creditor_id, account_number) in self.seen:
+            raise ValueError(f"Account number '{account_number}' appears more than once for creditor '{creditor_id}'")
+        self.seen.add((creditor_id, account_number))
+
+        record = {
+            'id': str(uuid.uuid4()),
+            'consumer_id': consumer_id,
+            'account_number': account_number,
+            'original_balance': _amount(row[2]),
+            'current_balance': current_balance,
+            'principal_balance': _amount(row[4], current_balance),
+            'interest_balance': _amount(row[5], 0),
+            'fee_balance': _amount(row[6], 0),
+            'creditor_id': creditor_id,
+            'placement_date': date.today(),
+            'status': 'active'
+        }
+        record['import_hash'] = hashlib.sha1('\x1f'.join(
+            str(record[column]) for column in self.update_columns[:-1]
+        ).encode()).hexdigest()
+        return record
+
+    def insert_chunk(self, records):
+        """Upsert new and changed accounts in one statement; rows whose hash matches are skipped"""
+        existing = {
+            (creditor_id, account_number): import_hash
+            for creditor_id, account_number, import_hash in db.session.query(
+                Account.creditor_id, Account.account_number, Account.import_hash
+            ).filter(db.tuple_(Account.creditor_id, Account.account_number).in_(
+                [(record['creditor_id'], record['account_number']) for record in records]
+            ))
+        }
+        changed = [
+            record for record in records
+            if existing.get((record['creditor_id'], record['account_number']), '') != record['import_hash']
+        ]
+        if changed:
+            db.session.execute(upsert(
+                Account.__table__, ('creditor_id', 'account_number'), self.update_columns
+            ), changed)
+
+        updated = sum(1 for record in changed if (record['creditor_id'], record['account_number']) in existing)
+        return {
+            'inserted': len(changed) - updated,
+            'updated': updated,
+            'unchanged': len(records) - len(changed)
+        }
+
+
+class SettlementImporter(BaseImporter):
+    model = Settlement
+    columns = 5
+
+    def validate_chunk(self, records):
+        return self.reject_missing(records, Account, 'account_id', 'Account')
+
+    def parse_row(self, row):
+        account_id = str(row[0]).strip()
+        return {
+            'id': str(uuid.uuid4()),
+            'account_id': account_id,
+            'original_balance': _amount(row[1]),
+            'settlement_amount': _amount(row[2]),
+            'discount_percentage': float(row[3]) if row[3] else None,
+            'notes': _text(row[4]),
+            'created_by': self.created_by
+        }
+
+
+class PaymentScheduleImporter(BaseImporter):
+    model = PaymentSchedule
+    columns = 5
+    frequencies = ('weekly', 'monthly', 'quarterly')
+
+    def validate_chunk(self, records):
+        return self.reject_missing(records, Account, 'account_id', 'Account')
+
+    def parse_row(self, row):
+        account_id = str(row[0]).strip()
+        frequency = (_text(row[3]) or '').lower()
+        if frequency not in self.frequencies:
+            raise ValueError(f"Invalid frequency '{row[3]}'")
+        start_date = _date(row[4])
+
+        return {
+            'id': str(uuid.uuid4()),
+            'account_id': account_id,
+            'total_amount': _amount(row[1]),
+            'payment_amount': _amount(row[2]),
+            'frequency': frequency,
+            'start_date': start_date,
+            'created_by': self.created_by
+        }
+
+
+class PaymentImporter(BaseImporter):
+    """Imports M-Pesa/bank statement lines, skipping references already on file.
+
+    Each chunk's payments are inserted in bulk, then balances are reduced with one
+    executemany UPDATE of per-account totals and last payment rollups refreshed,
+    all in the chunk's transaction.
+    """
+    model = Payment
+    columns = 5
+    methods = ('mpesa', 'bank_transfer', 'cash', 'cheque')
+    method_aliases = {'m-pesa': 'mpesa', 'bank': 'bank_transfer', 'check': 'cheque'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = set()  # Reference numbers already accepted from this file
+
+    def parse_row(self, row):
+        account_id = str(row[0]).strip()
+        reference_number = _text(row[3])
+        method = (_text(row[2]) or '').lower().replace(' ', '_')
+        method = self.method_aliases.get(method, method)
+        if not reference_number:
+            raise ValueError('Reference number is required')
+        if method not in self.methods:
+            raise ValueError(f"Invalid payment method '{row[2]}'")
+        amount = _amount(row[1])
+        if amount <= 0:
+            raise ValueError('Amount must be positive')
+        paid_at = _datetime(row[4]) if _text(row[4]) else datetime.utcnow()
+
+        # Repeats within the file count as duplicates too, not just those already stored
+        duplicate = reference_number in self.seen
+        self.seen.add(reference_number)
+        return {
+            'id': str(uuid.uuid4()),
+            'account_id': account_id,
+            'amount': Decimal(str(amount)),
+            'payment_method': method,
+            'status': 'completed',
+            'processed_date': paid_at,
+            'reference_number': reference_number,
+            'created_by': self.created_by,
+            'created_at': paid_at,
+            'duplicate': duplicate
+        }
+
+    def validate_chunk(self, records):
+        return self.reject_missing(records, Account, 'account_id', 'Account')
+
+    def insert_chunk(self, records):
+        """Insert new payments and apply their totals to account balances"""
+        existing = {row[0] for row in db.session.query(Payment.reference_number).filter(
+            Payment.reference_number.in_([record['reference_number'] for record in records])
+        )}
+        new = [
+            {key: value for key, value in record.items() if key != 'duplicate'}
+            for record in records
+            if not record['duplicate'] and record['reference_number'] not in existing
+        ]
+        if new:
+            db.session.execute(Payment.__table__.insert(), new)
+
+            deltas = defaultdict(Decimal)
+            for record in new:
+                deltas[record['account_id']] += record['amount']
+            account = Account.__table__
+            db.session.execute(
+                account.update().where(account.c.id == db.bindparam('account_id')).values(
+                    current_balance=account.c.current_balance - db.bindparam('delta')
+                ),
+                [{'account_id': account_id, 'delta': delta} for account_id, delta in deltas.items()]
+            )
+            Account.refresh_payment_rollups(list(deltas))
+
+        return {'inserted': len(new), 'duplicates': len(records) - len(new)}
+
+
+class OfficerImporter(BaseImporter):
+    model = User
+    columns = 5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = set()  # Usernames/emails already accepted from this file
+
+    def preload(self):
+        self.region_ids = {code: region_id for region_id, code in db.session.query(Region.id, Region.code)}
+
+    def parse_row(self, row):
+        username = str(row[0]).strip()
+        email = _text(row[1])
+        password = _text(row[2])
+        region_code = _text(row[3])
+        active = str(row[4]).strip().lower() in ['true', 'yes', '1'] if row[4] else True
+        if not email or not password:
+            raise ValueError('Email and password are required')
+
+        # Duplicates within the file; duplicates in the database are checked per chunk
+        if username in self.seen or email in self.seen:
+            raise ValueError(f"User '{username}' or email '{email}' already exists")
+
+        # Find region by code
+        region_id = None
+        if region_code:
+            region_id = self.region_ids.get(region_code)
+            if not region_id:
+                raise ValueError(f"Region code '{region_code}' not found")
+
+        self.seen.update((username, email))
+        return {
+            'id': str(uuid.uuid4()),
+            'username': username,
+            'email': email,
+            'password_hash': password,  # Plain text until prepare_chunk hashes the chunk
+            'role': 'collections_officer',
+            'region_id': region_id,
+            'active': active,
+            'created_at': datetime.utcnow()
+        }
+
+    def validate_chunk(self, records):
+        usernames = {record['username'] for _, record in records}
+        emails = {record['email'] for _, record in records}
+        existing = set()
+        for username, email in db.session.query(User.username, User.email).filter(
+            User.username.in_(usernames) | User.email.in_(emails)
+        ):
+            existing.update((username, email))
+
+        return {
+            row_idx: f"User '{record['username']}' or email '{record['email']}' already exists"
+            for row_idx, record in records
+            if record['username'] in existing or record['email'] in existing
+        }
+
+    def prepare_chunk(self, records):
+        # Hash only rows that will be inserted, fanned out over the hashing pool
+        hashes = hash_passwords(record['password_hash'] for _, record in records)
+        for (_, record), password_hash in zip(records, hashes):
+            record['password_hash'] = password_hash
+
+
+class LegalCaseImporter(BaseImporter):
+    """Upserts NDJSON case updates from law firms, keyed on case_number; each row is one raw line"""
+    model = LegalCase
+    columns = 1
+    row_label = 'Line'
+    # NDJSON keys a case update may change, and their columns
+    fields = {'caseType': 'case_type', 'status': 'status', 'filedDate': 'filed_date',
+              'resolutionDate': 'resolution_date', 'recoveryAmount': 'recovery_amount',
+              'legalCosts': 'legal_costs', 'assignedFirm': 'assigned_firm', 'notes': 'notes'}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.seen = set()  # Case numbers already accepted from this upload
+
+    def parse_row(self, row):
+        try:
+            case_data = json.loads(row[0])
+        except ValueError as e:
+            raise ValueError(f'Invalid JSON: {str(e)}')
+        if not isinstance(case_data, dict):
+            raise ValueError('Expected a JSON object')
+
+        case_number = _text(case_data.get('caseNumber'))
+        account_id = _text(case_data.get('accountId'))
+        if not case_number or not account_id:
+            raise ValueError('caseNumber and accountId are required')
+        if case_number in self.seen:
+            raise ValueError(f"Case number '{case_number}' appears more than once")
+        case_type = case_data.get('caseType', 'court_case')
+        if case_type not in LegalCase.case_type.type.enums:
+            raise ValueError(f"Invalid case type '{case_type}'")
+        status = case_data.get('status', 'pending')
+        if status not in LegalCase.status.type.enums:
+            raise ValueError(f"Invalid status '{status}'")
+
+        record = {
+            'id': str(uuid.uuid4()),
+            'account_id': account_id,
+            'case_number': case_number,
+            'case_type': case_type,
+            'status': status,
+            'filed_date': _date(case_data['filedDate']) if case_data.get('filedDate') else None,
+            'resolution_date': _date(case_data['resolutionDate']) if case_data.get('resolutionDate') else None,
+            'recovery_amount': _amount(case_data.get('recoveryAmount'), 0),
+            'legal_costs': _amount(case_data.get('legalCosts'), 0),
+            'assigned_firm': case_data.get('assignedFirm'),
+            'notes': case_data.get('notes'),
+            'created_by': self.created_by,
+            'created_at': datetime.utcnow(),
+            # Defaults above only fill new cases; an existing case only takes the fields the line sent
+            'update_columns': ('account_id',) + tuple(
+                column for key, column in self.fields.items() if key in case_data
+            )
+        }
+        self.seen.add(case_number)
+        return record
+
+    def validate_chunk(self, records):
+        return self.reject_missing(records, Account, 'account_id', 'Account')
+
+    def insert_chunk(self, records):
+        """Insert new cases and update existing ones by case_number, one statement per set of fields sent"""
+        existing = {row[0] for row in db.session.query(LegalCase.case_number).filter(
+            LegalCase.case_number.in_([record['case_number'] for record in records])
+        )}
+        by_columns = defaultdict(list)
+        for record in records:
+            record = dict(record)
+            by_columns[record.pop('update_columns')].append(record)
+        for update_columns, rows in by_columns.items():
+            db.session.execute(upsert(LegalCase.__table__, ('case_number',), update_columns), rows)
+        return {'inserted': len(records) - len(existing), 'updated': len(existing)}
+
+
+IMPORTERS = {
+    'consumer_import': ConsumerImporter,
+    'account_import': AccountImporter,
+    'settlement_import': SettlementImporter,
+    'payment_schedule_import': PaymentScheduleImporter,
+    'payment_import': PaymentImporter,
+    'officer_import': OfficerImporter
+}
+
+
+class ImportService:
+    def __init__(self, max_workers=IMPORT_WORKERS):
+        self.max_workers = max_workers
+        self.executor = None
+
+    def _open_binary(self, file):
+        """Open a spooled path, or rewind an uploaded file object, for reading bytes"""
+        if isinstance(file, (str, os.PathLike)):
+            return open(file, 'rb')
+        file.seek(0)
+        return file
+
+    def detect_format(self, file):
+        """Sniff 'xlsx', 'csv' or 'csv.gz' from the file's leading bytes rather than its name"""
+        stream = self._open_binary(file)
+        magic = stream.read(4)
+        if stream is file:
+            file.seek(0)
+        else:
+            stream.close()
+        if magic.startswith(GZIP_MAGIC):
+            return 'csv.gz'
+        if magic == ZIP_MAGIC:
+            return 'xlsx'
+        return 'csv'
+
+    def read_rows(self, file):
+        """Stream (row_idx, values) pairs from a workbook or CSV/TSV file, skipping the header"""
+        file_format = self.detect_format(file)
+        if file_format == 'xlsx':
+            yield from self._read_workbook_rows(file)
+        else:
+            yield from self._read_delimited_rows(file, compressed=file_format == 'csv.gz')
+
+    def _read_workbook_rows(self, file):
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+                yield row_idx, row
+        finally:
+            wb.close()
+
+    def _read_delimited_rows(self, file, compressed=False):
+        """csv.reader over the (optionally gzipped) file, sniffing comma vs tab from the first lines"""
+        stream = self._open_binary(file)
+        if compressed:
+            stream = gzip.GzipFile(fileobj=stream)
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='replace', newline='')
+        try:
+            text.readline()  # Header
+            first = text.readline()
+            delimiter = '\t' if first.count('\t') > first.count(',') else ','
+            lines = itertools.chain([first], text) if first else text
+            # Row numbers match what the sender sees in a spreadsheet: header is row 1
+            for row_idx, row in enumerate(csv.reader(lines, delimiter=delimiter), start=2):
+                yield row_idx, row
+        finally:
+            text.close()
+
+    def read_ndjson_lines(self, stream):
+        """Stream (line_no, (line,)) pairs from an NDJSON body without buffering it"""
+        for line_no, line in enumerate(stream, start=1):
+            yield line_no, (line.decode('utf-8', errors='replace').strip(),)
+
+    def estimate_rows(self, path):
+        """Data row count from the sheet dimensions or line count, or None if unknown"""
+        file_format = self.detect_format(path)
+        if file_format == 'csv.gz':
+            return None  # Counting would mean decompressing the whole file twice
+        if file_format == 'csv':
+            with open(path, 'rb') as f:
+                lines = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b''))
+            return max(lines - 1, 0)
+
+        wb = load_workbook(path, read_only=True)
+        try:
+            max_row = wb.active.max_row
+            return max(max_row - 1, 0) if max_row else None
+        finally:
+            wb.close()
+
+    def create_job(self, job_type, file, created_by, spool_dir):
+        """Spool an uploaded file to disk and record a pending BatchJob for it"""
+        job_id = str(uuid.uuid4())
+        os.makedirs(spool_dir, exist_ok=True)
+        path = os.path.join(spool_dir, job_id + os.path.splitext(file.filename or '')[1].lower())
+        file.save(path)
+
+        job = BatchJob(
+            id=job_id,
+            filename=file.filename,
+            job_type=job_type,
+            status='pending',
+            file_path=path,
+            created_by=created_by
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def submit(self, app, job_id):
+        """Queue a job on the background import workers"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='import')
+        return self.executor.submit(self._run_job, app, job_id)
+
+    def _run_job(self, app, job_id):
+        with app.app_context():
+            try:
+                return self.process_job(job_id)
+            except Exception as e:
+                print(f"Import job {job_id} crashed: {str(e)}")
+
+    def claim_job(self, job):
+        """Atomically move a job to processing so that only one worker runs it"""
+        claimed = db.session.execute(
+            db.update(BatchJob).where(
+                BatchJob.id == job.id,
+                BatchJob.status == job.status,
+                BatchJob.updated_at == job.updated_at
+            ).values(status='processing', updated_at=datetime.utcnow())
+        ).rowcount == 1
+        db.session.commit()
+        return claimed
+
+    def process_job(self, job_id):
+        """Run (or resume) a spooled import job, checkpointing progress after every chunk"""
+        job = db.session.get(BatchJob, job_id)
+        if not job or job.status == 'completed' or job.job_type not in IMPORTERS:
+            return None
+        # Leave jobs that another worker is still heartbeating alone
+        if job.status == 'processing' and job.updated_at and job.updated_at > datetime.utcnow() - STALE_JOB_AFTER:
+            return None
+        if not self.claim_job(job):
+            return None
+
+        result = {
+            'imported': job.success_records or 0,
+            'failed': job.failed_records or 0,
+            'skipped': (job.processed_records or 0) - (job.success_records or 0) - (job.failed_records or 0),
+            # A previous run's failure no longer applies once the job is running again
+            'errors': [error for error in (json.loads(job.error_log) if job.error_log else [])
+                       if not error.startswith(JOB_FAILED)],
+            'counts': json.loads(job.result_counts) if job.result_counts else {}
+        }
+        resume_after = job.last_row or 0
+        try:
+            if not job.total_records:
+                job.total_records = self.estimate_rows(job.file_path) or 0
+                db.session.commit()
+
+            def checkpoint(result, last_row):
+                db.session.execute(db.update(BatchJob).where(BatchJob.id == job_id).values(
+                    processed_records=processed_rows(result),
+                    success_records=result['imported'],
+                    failed_records=result['failed'],
+                    last_row=last_row,
+                    error_log=json.dumps(result['errors']),
+                    result_counts=json.dumps(result['counts']),
+                    updated_at=datetime.utcnow()
+                ))
+
+            importer = IMPORTERS[job.job_type](created_by=job.created_by)
+            rows = ((row_idx, row) for row_idx, row in self.read_rows(job.file_path) if row_idx > resume_after)
+            importer.run(rows, result=result, checkpoint=checkpoint)
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(BatchJob, job_id)
+            job.status = 'failed'
+            job.updated_at = datetime.utcnow()
+            job.error_log = json.dumps(result['errors'] + [f'{JOB_FAILED}{str(e)}'])
+            db.session.commit()
+            return result
+
+        job = db.session.get(BatchJob, job_id)
+        job.status = 'completed'
+        # Every row read was imported, failed or skipped, so the file's row count is now exact; the start was an estimate
+        job.total_records = job.processed_records = processed_rows(result)
+        job.error_log = json.dumps(result['errors'])
+        job.completed_at = job.updated_at = datetime.utcnow()
+        db.session.commit()
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+        return result
+
+    def can_resume(self, job):
+        return (job.job_type in IMPORTERS and job.status != 'completed'
+                and bool(job.file_path) and os.path.exists(job.file_path))
+
+    def resume_jobs(self, app):
+        """Re-queue pending or stalled jobs (e.g. after a crash or redeploy) from their last checkpoint"""
+        stale_before = datetime.utcnow() - STALE_JOB_AFTER
+        jobs = BatchJob.query.filter(
+            BatchJob.status.in_(['pending', 'processing']),
+            db.or_(BatchJob.updated_at.is_(None), BatchJob.updated_at < stale_before)
+        ).all()
+        resumed = [job.id for job in jobs if self.can_resume(job)]
+        for job_id in resumed:
+            self.submit(app, job_id)
+        return resumed
+
+import_service = ImportService()
@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from calendar import monthrange
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from models import db, Job, JobExecution, SchedulerLease, EmailNotification, email_notification_alert
+
+LEASE_NAME = 'job_scheduler'
+LEASE_TTL = timedelta(seconds=60)  # A leader that stops renewing is replaced after this long
+TICK_SECONDS = 15  # How often nodes renew or contend for the lease and look for due jobs
+JOB_WORKERS = 4
+
+DEFAULT_JOBS = (
+    {'name': 'Alert checks', 'job_type': 'email_alert', 'schedule': '0 1,5,9,13,17,21 * * *', 'config': {}},
+    {'name': 'Full alert rescan', 'job_type': 'email_alert', 'schedule': '0 2 * * sun', 'config': {'fullScan': True}},
+    {'name': 'Scheduled reports', 'job_type': 'report_generation', 'schedule': '30 6 * * *', 'config': {}},
+    {'name': 'Notification cleanup', 'job_type': 'data_cleanup', 'schedule': '0 3 * * *', 'config': {'retentionDays': 90}},
+)
+
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *',
+}
+MONTH_NAMES = {name: i + 1 for i, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])}
+DAY_NAMES = {name: i for i, name in enumerate(['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'])}
+
+
+class CronSchedule:
+    """Standard five-field cron expression (minute hour day-of-month month day-of-week), in UTC"""
+
+    def __init__(self, expression):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron expression needs 5 fields: {expression}')
+        self.minutes = self._parse(fields[0], 0, 59)
+        self.hours = self._parse(fields[1], 0, 23)
+        self.days = self._parse(fields[2], 1, 31)
+        self.months = self._parse(fields[3], 1, 12, MONTH_NAMES)
+        self.weekdays = {day % 7 for day in self._parse(fields[4], 0, 7, DAY_NAMES)}  # 7 is also Sunday
+        # Like cron, restricting both day fields matches either of them
+        self.any_day = fields[2].startswith('*')
+        self.any_weekday = fields[4].startswith('*')
+
+    def _parse(self, field, low, high, names=None):
+        values = set()
+        for part in field.lower().split(','):
+            span, _, step = part.partition('/')
+            if span == '*':
+                start, end = low, high
+            else:
+                start, _, end = span.partition('-')
+                start = self._value(start, names)
+                end = self._value(end, names) if end else (high if step else start)
+            step = int(step) if step else 1
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f'Invalid cron field: {field}')
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _value(self, token, names):
+        if names and token in names:
+            return names[token]
+        if not token.isdigit():
+            raise ValueError(f'Invalid cron value: {token}')
+        return int(token)
+
+    def _day_matches(self, moment):
+        in_month = moment.day in self.days
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return in_week
+        if self.any_weekday:
+            return in_month
+        return in_month or in_week
+
+    def next_after(self, moment):
+        """First matching minute strictly after moment"""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        give_up = moment + timedelta(days=366 * 5)
+        while moment < give_up:
+            if moment.month not in self.months:
+                moment = moment.replace(day=1, hour=0, minute=0) + timedelta(days=monthrange(moment.year, moment.month)[1])
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f'Cron expression never matches: {self.expression}')
+
+
+def run_alert_checks(job, config):
+    from alert_service import alert_service
+    stats = alert_service.run_daily_checks(full_scan=bool(config.get('fullScan')))
+    return dict(stats,
+                rows_affected=stats['payment_due'] + stats['payment_overdue'] + stats['high_priority'],
+                emails_sent=stats.get('digestRecipients', 0))
+
+
+def run_scheduled_reports(job, config):
+    from report_generator import report_generator
+    stats = report_generator.execute_scheduled_reports()
+    return dict(stats, rows_affected=stats['reports'], emails_sent=stats['emails'])
+
+
+def run_notification_cleanup(job, config):
+    """Delete delivered or abandoned notifications and finished job executions past their retention"""
+    cutoff = datetime.utcnow() - timedelta(days=int(config.get('retentionDays', 90)))
+    old_notifications = db.select(EmailNotification.id).where(
+        EmailNotification.status.in_(['sent', 'failed']),
+        EmailNotification.created_at < cutoff
+    )
+    db.session.execute(email_notification_alert.delete().where(
+        email_notification_alert.c.notification_id.in_(old_notifications)
+    ))
+    notifications = db.session.execute(db.delete(EmailNotification).where(
+        EmailNotification.id.in_(old_notifications.scalar_subquery())
+    ).execution_options(synchronize_session=False)).rowcount
+    executions = db.session.execute(db.delete(JobExecution).where(
+        JobExecution.status != 'running',
+        JobExecution.started_at < cutoff
+    ).execution_options(synchronize_session=False)).rowcount
+    db.session.commit()
+    return {'notifications': notifications, 'executions': executions, 'rows_affected': notifications + executions}
+
+
+# Job.job_type -> handler(job, config) returning a result dict; rows_affected and emails_sent are recorded
+JOB_HANDLERS = {
+    'email_alert': run_alert_checks,
+    'report_generation': run_scheduled_reports,
+    'data_cleanup': run_notification_cleanup,
+}
+
+
+class JobScheduler:
+    """Runs Job rows on their cron schedules from whichever node holds the scheduler lease.
+
+    Every node calls tick() periodically. The lease holder renews it, computes next_run for
+    new jobs and dispatches due ones to a thread pool; the others stand by and take over
+    once the lease expires. Each run is recorded as a JobExecution.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.node_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.is_leader = False
+        self.running = set()  # Job ids with a run in flight on this node
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def acquire_lease(self):
+        """Take or renew the scheduler lease; True if this node holds it"""
+        now = datetime.utcnow()
+        renewed = db.session.execute(db.update(SchedulerLease).where(
+            SchedulerLease.name == LEASE_NAME,
+            db.or_(SchedulerLease.holder == self.node_id, SchedulerLease.expires_at < now)
+        ).values(holder=self.node_id, expires_at=now + LEASE_TTL)).rowcount
+        if renewed:
+            db.session.commit()
+            return True
+        if db.session.get(SchedulerLease, LEASE_NAME) is not None:
+            db.session.rollback()
+            return False
+        try:
+            db.session.add(SchedulerLease(name=LEASE_NAME, holder=self.node_id, expires_at=now + LEASE_TTL))
+            db.session.commit()
+            return True
+        except IntegrityError:
+            # Another node created the lease first
+            db.session.rollback()
+            return False
+
+    def release_lease(self):
+        db.session.execute(db.delete(SchedulerLease).where(
+            SchedulerLease.name == LEASE_NAME,
+            SchedulerLease.holder == self.node_id
+        ))
+        db.session.commit()
+        self.is_leader = False
+
+    def install_default_jobs(self):
+        """Create the built-in jobs the first time the scheduler finds no jobs at all"""
+        if db.session.query(Job.id).first() is None:
+            db.session.execute(Job.__table__.insert(), [
+                dict(job, id=str(uuid.uuid4()), config=json.dumps(job['config']), status='idle', enabled=True)
+                for job in DEFAULT_JOBS
+            ])
+            db.session.commit()
+
+    def recover_interrupted(self):
+        """Fail runs a previous leader left 'running', so their jobs are scheduled again"""
+        now = datetime.utcnow()
+        with self.lock:
+            running = list(self.running)  # Still in flight here, from before this node lost the lease
+        db.session.execute(db.update(JobExecution).where(
+            JobExecution.status == 'running',
+            JobExecution.job_id.notin_(running)
+        ).values(
+            status='failed', completed_at=now,
+            result=json.dumps({'error': 'Interrupted: scheduler node stopped'})
+        ))
+        db.session.execute(db.update(Job).where(Job.status == 'running', Job.id.notin_(running)).values(status='failed'))
+        db.session.commit()
+
+    def schedule_new_jobs(self, now):
+        """Compute next_run for enabled jobs that have a schedule but no next run yet"""
+        for job in Job.query.filter(
+            Job.enabled.is_(True),
+            Job.schedule.isnot(None),
+            Job.next_run.is_(None),
+            Job.status != 'failed'
+        ):
+            try:
+                job.next_run = CronSchedule(job.schedule).next_after(now)
+            except ValueError as e:
+                job.status = 'failed'
+                print(f"Job {job.name} has an invalid schedule: {str(e)}")
+        db.session.commit()
+
+    def claim_due_jobs(self, now):
+        """Advance each due job's next_run and open its execution, skipping jobs still running"""
+        claimed = []
+        for job in Job.query.filter(
+            Job.enabled.is_(True),
+            Job.next_run <= now,
+            Job.status != 'running'
+        ).order_by(Job.next_run).all():
+            if job.id in self.running:
+                continue
+            try:
+                next_run = CronSchedule(job.schedule).next_after(now)  # Missed runs coalesce into this one
+            except ValueError as e:
+                next_run = None
+                print(f"Job {job.name} has an invalid schedule: {str(e)}")
+            # Conditional on next_run, so a run is claimed once even if two nodes briefly overlap
+            updated = db.session.execute(db.update(Job).where(
+                Job.id == job.id,
+                Job.next_run == job.next_run
+            ).values(next_run=next_run, status='running', last_run=now).execution_options(
+                synchronize_session=False
+            )).rowcount
+            if updated:
+                claimed.append(self.start_execution(job.id, now))
+        db.session.commit()
+        return claimed
+
+    def start_execution(self, job_id, now=None):
+        execution = JobExecution(id=str(uuid.uuid4()), job_id=job_id, status='running',
+                                 started_at=now or datetime.utcnow())
+        db.session.add(execution)
+        with self.lock:
+            self.running.add(job_id)
+        return job_id, execution.id
+
+    def execute(self, job_id, execution_id):
+        """Run a claimed job and record its outcome; needs an app context"""
+        job = db.session.get(Job, job_id)
+        started = time.perf_counter()
+        try:
+            handler = JOB_HANDLERS.get(job.job_type)
+            if handler is None:
+                raise ValueError(f'No handler for job type {job.job_type}')
+            result = handler(job, json.loads(job.config or '{}'))
+            status = 'completed'
+        except Exception as e:
+            db.session.rollback()
+            result = {'error': str(e)}
+            status = 'failed'
+        finally:
+            with self.lock:
+                self.running.discard(job_id)
+
+        execution = db.session.get(JobExecution, execution_id)
+        execution.status = status
+        execution.completed_at = datetime.utcnow()
+        execution.duration_seconds = round(time.perf_counter() - started, 3)
+        execution.rows_affected = result.pop('rows_affected', 0)
+        execution.emails_sent = result.pop('emails_sent', 0)
+        execution.result = json.dumps(result, default=str)
+        job = db.session.get(Job, job_id)
+        job.status = status
+        db.session.commit()
+        return execution
+
+    def run_job(self, job_id):
+        """Run a job now, outside its schedule, in the caller's app context"""
+        job_id, execution_id = self.start_execution(job_id)
+        db.session.execute(db.update(Job).where(Job.id == job_id).values(status='running', last_run=datetime.utcnow()))
+        db.session.commit()
+        return self.execute(job_id, execution_id)
+
+    def _execute_in_context(self, app, job_id, execution_id):
+        with app.app_context():
+            try:
+                self.execute(job_id, execution_id)
+            except Exception as e:
+                print(f"Error recording job {job_id}: {str(e)}")
+
+    def tick(self, app):
+        """Contend for the lease and, as leader, dispatch due jobs; returns the dispatched job ids"""
+        with app.app_context():
+            try:
+                was_leader = self.is_leader
+                self.is_leader = self.acquire_lease()
+                if not self.is_leader:
+                    return []
+                if not was_leader:
+                    print(f"[{datetime.now()}] Scheduler node {self.node_id} took the lease")
+                    self.install_default_jobs()
+                    self.recover_interrupted()
+                now = datetime.utcnow()
+                self.schedule_new_jobs(now)
+                claimed = self.claim_due_jobs(now)
+            except Exception as e:
+                db.session.rollback()
+                print(f"[{datetime.now()}] Scheduler tick failed: {str(e)}")
+                return []
+        for job_id, execution_id in claimed:
+            self.executor.submit(self._execute_in_context, app, job_id, execution_id)
+        return [job_id for job_id, _ in claimed]
+
+    def _loop(self, app):
+        while not self.stopped.is_set():
+            dispatched = self.tick(app)
+            if dispatched:
+                print(f"[{datetime.now()}] Dispatched {len(dispatched)} scheduled jobs")
+            self.stopped.wait(TICK_SECONDS)
+
+    def start(self, app):
+        """Tick on a background thread, so slow work elsewhere in the process cannot let the lease lapse"""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._loop, args=(app,), name='job-scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self, app):
+        """Stop ticking, wait for running jobs and hand the lease over without waiting for it to expire"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.executor.shutdown(wait=True)
+        with app.app_context():
+            self.release_lease()
+
+
+job_scheduler = JobScheduler()
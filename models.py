@@ -1,11 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
+from decimal import Decimal
 from werkzeug.security import generate_password_hash, check_password_hash
 import json
 import uuid
 
 db = SQLAlchemy()
 
+def conflict_insert(table):
+    """Dialect-specific INSERT for the bound database, supporting ON CONFLICT clauses"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f'ON CONFLICT is not supported on {dialect}')
+    return insert(table)
+
 # User Management
 class User(db.Model):
     id = db.Column(db.String(50), primary_key=True)
@@ -58,6 +70,11 @@ class Consumer(db.Model):
     location_verifier = db.relationship('User', foreign_keys=[location_verified_by])
 
 class Account(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('creditor_id', 'account_number', name='uq_account_creditor_number'),
+        db.Index('ix_account_assigned_officer', 'assigned_officer_id'),
+    )
+    
     id = db.Column(db.String(50), primary_key=True)
     consumer_id = db.Column(db.String(50), db.ForeignKey('consumer.id'), nullable=False)
     creditor_id = db.Column(db.String(50), db.ForeignKey('creditor.id'), nullable=False)
@@ -74,11 +91,40 @@ class Account(db.Model):
     collateral_status = db.Column(db.Enum('available', 'repossessed', 'sold', 'under_valuation', 'disputed', 'not_applicable', name='collateral_status'), default='not_applicable')
     collateral_value = db.Column(db.Numeric(15, 2))
     collateral_description = db.Column(db.Text)
+    last_payment_date = db.Column(db.DateTime)  # Rolled up from Payment
+    last_payment_amount = db.Column(db.Numeric(15, 2))
+    import_hash = db.Column(db.String(40))  # Hash of the placement file columns, to skip unchanged rows
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Row version for incremental alert checks
     
     creditor = db.relationship('Creditor')
     assigned_officer = db.relationship('User')
     payments = db.relationship('Payment', backref='account')
+    
+    def apply_payment(self, amount, paid_at=None):
+        """Deduct a payment from the balance and roll it up into last payment details"""
+        amount = Decimal(str(amount))
+        paid_at = paid_at or datetime.utcnow()
+        self.current_balance -= amount
+        if self.last_payment_date is None or paid_at >= self.last_payment_date:
+            self.last_payment_date = paid_at
+            self.last_payment_amount = amount
+    
+    @staticmethod
+    def refresh_payment_rollups(account_ids=None):
+        """Recompute last payment date/amount from the payment table in one UPDATE"""
+        latest = db.select(Payment).where(
+            Payment.account_id == Account.id,
+            Payment.status != 'failed'
+        ).order_by(Payment.created_at.desc()).limit(1)
+        
+        stmt = db.update(Account).values(
+            last_payment_date=latest.with_only_columns(Payment.created_at).scalar_subquery(),
+            last_payment_amount=latest.with_only_columns(Payment.amount).scalar_subquery()
+        )
+        if account_ids is not None:
+            stmt = stmt.where(Account.id.in_(account_ids))
+        return db.session.execute(stmt.execution_options(synchronize_session=False)).rowcount
 
 class Creditor(db.Model):
     id = db.Column(db.String(50), primary_key=True)
@@ -90,19 +136,27 @@ class Creditor(db.Model):
     active = db.Column(db.Boolean, default=True)
 
 class Payment(db.Model):
+    __table_args__ = (
+        db.Index('ix_payment_status_processed', 'status', 'processed_date'),  # Report date ranges
+    )
+    
     id = db.Column(db.String(50), primary_key=True)
     account_id = db.Column(db.String(50), db.ForeignKey('account.id'), nullable=False)
     amount = db.Column(db.Numeric(15, 2), nullable=False)
     payment_method = db.Column(db.Enum('mpesa', 'bank_transfer', 'cash', 'cheque'), nullable=False)
     status = db.Column(db.Enum('pending', 'completed', 'failed'), default='pending')
     processed_date = db.Column(db.DateTime)
-    reference_number = db.Column(db.String(100))
+    reference_number = db.Column(db.String(100), unique=True)  # M-Pesa/bank reference; dedupes statement imports
     created_by = db.Column(db.String(50), db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     created_by_user = db.relationship('User')
 
 class PromiseToPay(db.Model):
+    __table_args__ = (
+        db.Index('ix_promise_to_pay_created_at', 'created_at'),  # Report date ranges
+    )
+    
     id = db.Column(db.String(50), primary_key=True)
     account_id = db.Column(db.String(50), db.ForeignKey('account.id'), nullable=False)
     consumer_id = db.Column(db.String(50), db.ForeignKey('consumer.id'), nullable=False)
@@ -151,6 +205,18 @@ class Escalation(db.Model):
     escalated_by_user = db.relationship('User', foreign_keys=[escalated_by])
     escalated_to_user = db.relationship('User', foreign_keys=[escalated_to])
 
+class EscalationRule(db.Model):
+    """Balance band and placement age that raise a high priority alert and periodic auto-escalation"""
+    id = db.Column(db.String(50), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # Alert title and escalation reason, e.g. 'Critical Account'
+    min_balance = db.Column(db.Numeric(15, 2), nullable=False)  # Balance must exceed this
+    max_balance = db.Column(db.Numeric(15, 2))  # Balance at most this; None for no upper bound
+    min_age_days = db.Column(db.Integer, nullable=False)  # Days since placement before the rule applies
+    cadence_days = db.Column(db.Integer, default=30)  # Escalate whenever the age is a multiple of this
+    priority = db.Column(db.Enum('low', 'medium', 'high', 'critical'), default='high')
+    active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 # Additional Tables for Comprehensive Testing
 class PaymentSchedule(db.Model):
     id = db.Column(db.String(50), primary_key=True)
@@ -202,8 +268,13 @@ class BatchJob(db.Model):
     processed_records = db.Column(db.Integer, default=0)
     success_records = db.Column(db.Integer, default=0)
     failed_records = db.Column(db.Integer, default=0)
+    file_path = db.Column(db.String(500))  # Spooled upload
+    last_row = db.Column(db.Integer, default=0)  # Last row committed, for resuming
+    error_log = db.Column(db.Text)  # JSON array of row errors
+    result_counts = db.Column(db.Text)  # JSON object, e.g. inserted/updated/unchanged for upserts
     created_by = db.Column(db.String(50), db.ForeignKey('user.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)  # Worker heartbeat
     completed_at = db.Column(db.DateTime)
     
     created_by_user = db.relationship('User')
@@ -245,11 +316,33 @@ class JobExecution(db.Model):
     completed_at = db.Column(db.DateTime)
     result = db.Column(db.Text)
     emails_sent = db.Column(db.Integer, default=0)
+    rows_affected = db.Column(db.Integer, default=0)
+    duration_seconds = db.Column(db.Float)
     
     job = db.relationship('Job')
 
+class SchedulerLease(db.Model):
+    """Time-limited lock naming the one scheduler node allowed to run due jobs"""
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
 # Alert System
+def alert_dedupe_key(alert_type, account_id=None, due_date=None):
+    """Identity of an alert for duplicate suppression: one active alert per type, account and due date"""
+    return f"{alert_type}:{account_id or ''}:{due_date.isoformat() if due_date else ''}"
+
+def _alert_dedupe_key_default(context):
+    params = context.get_current_parameters()
+    return alert_dedupe_key(params.get('alert_type'), params.get('account_id'), params.get('due_date'))
+
 class Alert(db.Model):
+    __table_args__ = (
+        # Only active alerts must be unique, so a resolved alert can be raised again
+        db.Index('uq_alert_active_dedupe_key', 'dedupe_key', unique=True,
+                 sqlite_where=db.text("status = 'active'"), postgresql_where=db.text("status = 'active'")),
+    )
+    
     id = db.Column(db.String(50), primary_key=True)
     alert_type = db.Column(db.Enum('payment_due', 'payment_overdue', 'ptp_due', 'ptp_broken', 'high_priority'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
@@ -263,12 +356,51 @@ class Alert(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     acknowledged_at = db.Column(db.DateTime)
     resolved_at = db.Column(db.DateTime)
+    dedupe_key = db.Column(db.String(200), default=_alert_dedupe_key_default)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # Alert stream cursor
     
     account = db.relationship('Account')
     consumer = db.relationship('Consumer')
     assigned_user = db.relationship('User')
 
+ALERT_COUNTER_STATUSES = ('active', 'acknowledged', 'resolved')
+ALERT_COUNTER_PRIORITIES = ('low', 'medium', 'high', 'critical')
+
+class AlertCounter(db.Model):
+    """Alert totals by status and priority for one badge scope: 'user:<id>', 'region:<id>' or 'all'"""
+    scope = db.Column(db.String(60), primary_key=True)
+    active_low = db.Column(db.Integer, default=0, nullable=False)
+    active_medium = db.Column(db.Integer, default=0, nullable=False)
+    active_high = db.Column(db.Integer, default=0, nullable=False)
+    active_critical = db.Column(db.Integer, default=0, nullable=False)
+    acknowledged_low = db.Column(db.Integer, default=0, nullable=False)
+    acknowledged_medium = db.Column(db.Integer, default=0, nullable=False)
+    acknowledged_high = db.Column(db.Integer, default=0, nullable=False)
+    acknowledged_critical = db.Column(db.Integer, default=0, nullable=False)
+    resolved_low = db.Column(db.Integer, default=0, nullable=False)
+    resolved_medium = db.Column(db.Integer, default=0, nullable=False)
+    resolved_high = db.Column(db.Integer, default=0, nullable=False)
+    resolved_critical = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class AlertWatermark(db.Model):
+    """How far each alert check has evaluated, so the next run only looks at what changed since"""
+    check_name = db.Column(db.String(50), primary_key=True)
+    evaluated_at = db.Column(db.DateTime, nullable=False)  # Start of the last successful run
+    full_scan_at = db.Column(db.DateTime)  # Start of the last successful full (repair) scan
+
+# Alerts summarised by a digest EmailNotification
+email_notification_alert = db.Table(
+    'email_notification_alert',
+    db.Column('notification_id', db.String(50), db.ForeignKey('email_notification.id'), primary_key=True),
+    db.Column('alert_id', db.String(50), db.ForeignKey('alert.id'), primary_key=True)
+)
+
 class EmailNotification(db.Model):
+    __table_args__ = (
+        db.Index('ix_email_notification_outbox', 'status', 'next_attempt_at'),
+    )
+    
     id = db.Column(db.String(50), primary_key=True)
     recipient_email = db.Column(db.String(100), nullable=False)
     subject = db.Column(db.String(200), nullable=False)
@@ -277,10 +409,14 @@ class EmailNotification(db.Model):
     report_execution_id = db.Column(db.String(50), db.ForeignKey('report_execution.id'))
     status = db.Column(db.Enum('pending', 'sent', 'failed'), default='pending')
     sent_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, default=0)  # Delivery attempts made by the outbox worker
+    next_attempt_at = db.Column(db.DateTime)  # Retry backoff, or a worker's lease on the row
+    last_error = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     alert = db.relationship('Alert')
     report_execution = db.relationship('ReportExecution')
+    alerts = db.relationship('Alert', secondary=email_notification_alert)  # Digest contents
 class UDDTable(db.Model):
     id = db.Column(db.String(50), primary_key=True)
     table_name = db.Column(db.String(100), unique=True, nullable=False)
@@ -377,7 +513,7 @@ class PortfolioMetrics(db.Model):
 class LegalCase(db.Model):
     id = db.Column(db.String(50), primary_key=True)
     account_id = db.Column(db.String(50), db.ForeignKey('account.id'), nullable=False)
-    case_number = db.Column(db.String(100))
+    case_number = db.Column(db.String(100), unique=True)
     case_type = db.Column(db.Enum('demand_letter', 'court_case', 'arbitration', 'repossession'), nullable=False)
     status = db.Column(db.Enum('pending', 'in_progress', 'settled', 'dismissed', 'won', 'lost'), default='pending')
     filed_date = db.Column(db.Date)
@@ -0,0 +1,134 @@
+import smtplib
+import uuid
+from datetime import datetime, timedelta
+from models import db, EmailNotification
+from email_service import email_service as default_email_service
+from smtp_sender import PooledSMTPSender
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+RETRY_BASE = timedelta(minutes=1)  # Doubles after every failed attempt
+RETRY_MAX = timedelta(hours=1)
+CLAIM_LEASE = timedelta(minutes=5)  # How long a worker owns a claimed batch
+
+
+class NotificationOutbox:
+    """Transactional email outbox.
+
+    Callers queue EmailNotification rows as 'pending' in their own transaction, so an
+    email exists only if the alert/report that caused it was committed. A delivery
+    worker then drains due rows in batches, sending each batch concurrently over a pool
+    of persistent SMTP connections, and retries failures with exponential backoff until
+    MAX_ATTEMPTS.
+    """
+
+    def __init__(self, email_service=None, batch_size=BATCH_SIZE, sender=None):
+        self.email_service = email_service or default_email_service
+        self.batch_size = batch_size
+        self._sender = sender
+
+    @property
+    def sender(self):
+        if self._sender is None:
+            self._sender = PooledSMTPSender(self.email_service)
+        return self._sender
+
+    def queue(self, recipient_email, subject, body, alert_id=None, report_execution_id=None, alerts=None):
+        """Add a pending notification to the current transaction; callers commit.
+
+        alerts links a digest notification to every alert it summarises.
+        """
+        notification = EmailNotification(
+            id=str(uuid.uuid4()),
+            recipient_email=recipient_email,
+            subject=subject,
+            body=body,
+            alert_id=alert_id,
+            report_execution_id=report_execution_id,
+            status='pending',
+            attempts=0,
+            created_at=datetime.utcnow()
+        )
+        if alerts:
+            notification.alerts = list(alerts)
+        db.session.add(notification)
+        return notification
+
+    def _due(self, now):
+        return db.and_(
+            EmailNotification.status == 'pending',
+            db.or_(EmailNotification.next_attempt_at.is_(None), EmailNotification.next_attempt_at <= now)
+        )
+
+    def claim_batch(self, limit=None):
+        """Lease the oldest due notifications to this worker, so concurrent workers skip them"""
+        now = datetime.utcnow()
+        ids = [row[0] for row in db.session.query(EmailNotification.id).filter(
+            self._due(now)
+        ).order_by(EmailNotification.created_at).limit(limit or self.batch_size)]
+        if not ids:
+            return []
+
+        lease = now + CLAIM_LEASE
+        db.session.execute(db.update(EmailNotification).where(
+            EmailNotification.id.in_(ids), self._due(now)
+        ).values(next_attempt_at=lease).execution_options(synchronize_session=False))
+        db.session.commit()
+        return EmailNotification.query.filter(
+            EmailNotification.id.in_(ids),
+            EmailNotification.next_attempt_at == lease
+        ).order_by(EmailNotification.created_at).all()
+
+    def _retry_later(self, notification, error):
+        """Schedule another attempt with backoff, or give up; returns the stats key to count under"""
+        notification.attempts = (notification.attempts or 0) + 1
+        notification.last_error = str(error)[:1000]
+        if notification.attempts >= MAX_ATTEMPTS:
+            notification.status = 'failed'
+            notification.next_attempt_at = None
+        else:
+            notification.next_attempt_at = datetime.utcnow() + min(
+                RETRY_BASE * 2 ** (notification.attempts - 1), RETRY_MAX
+            )
+        return 'failed' if notification.status == 'failed' else 'retrying'
+
+    def deliver_pending(self, max_batches=None):
+        """Drain due notifications batch by batch through the pooled sender.
+
+        Returns {'sent': n, 'retrying': n, 'failed': n}.
+        """
+        stats = {'sent': 0, 'retrying': 0, 'failed': 0}
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            batch = self.claim_batch()
+            if not batch:
+                break
+            batches += 1
+
+            results = self.sender.send_many([
+                (n.id, n.recipient_email, n.subject, n.body) for n in batch
+            ])
+            interrupted = None
+            for notification in batch:
+                error = results[notification.id]
+                if error is None:
+                    notification.status = 'sent'
+                    notification.sent_at = datetime.utcnow()
+                    notification.next_attempt_at = None
+                    notification.attempts = (notification.attempts or 0) + 1
+                    stats['sent'] += 1
+                    continue
+                if not isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                                          smtplib.SMTPDataError)) and isinstance(error, OSError):
+                    # Connection-level failure (SMTP errors are OSErrors too) that survived a
+                    # reconnect: stop draining until the next run
+                    interrupted = error
+                stats[self._retry_later(notification, error)] += 1
+
+            db.session.commit()
+            if interrupted is not None:
+                print(f"Email delivery interrupted: {str(interrupted)}")
+                break
+        return stats
+
+notification_outbox = NotificationOutbox()
@@ -0,0 +1,58 @@
+import os
+import atexit
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash
+
+HASH_WORKERS = os.cpu_count() or 1
+TASKS_PER_WORKER = 4  # Batches handed to each worker per call, to even out stragglers
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """Return the shared hashing pool, starting (or resizing) it on first use"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(_reset_pool)
+
+
+def hash_passwords(passwords, workers=None):
+    """Hash many passwords across a process pool, returning hashes in input order.
+
+    PBKDF2 is CPU bound and holds the GIL, so bulk provisioning (imports, seeding)
+    spreads it over one process per core. Single passwords and single-core hosts
+    are hashed in-process.
+    """
+    passwords = list(passwords)
+    workers = workers or HASH_WORKERS
+    if workers <= 1 or len(passwords) <= 1:
+        return [generate_password_hash(password) for password in passwords]
+
+    chunksize = max(1, len(passwords) // (workers * TASKS_PER_WORKER))
+    try:
+        return list(_get_pool(workers).map(generate_password_hash, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OS); start a fresh pool next time
+        _reset_pool()
+        return [generate_password_hash(password) for password in passwords]
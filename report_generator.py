@@ -1,71 +1,104 @@
+import os
 import json
 import uuid
-from datetime import datetime, date, timedelta
-from sqlalchemy import func, and_
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time, timedelta
+from flask import current_app
+from sqlalchemy import func
 from models import (
-    db, User, Account, Payment, PromiseToPay, Consumer, Region,
+    db, User, Account, Payment, PromiseToPay,
     ReportTemplate, ReportExecution
 )
 from email_service import email_service
 
+REPORT_WORKERS = os.cpu_count() or 1  # Regions whose report data is built concurrently
+
+
+def day_start(day):
+    """Midnight opening a date, for index-friendly [start, end) ranges on DateTime columns"""
+    return datetime.combine(day, time.min)
+
+
 class ReportGenerator:
     
-    def generate_daily_report(self, region_id=None, user_id=None):
-        """Generate daily performance report"""
-        today = date.today()
-        
-        # Base query filters
+    def _scope_filters(self, region_id=None, user_id=None):
         filters = []
         if region_id:
             filters.append(User.region_id == region_id)
         if user_id:
             filters.append(User.id == user_id)
+        return filters
+    
+    def portfolio(self, region_id=None, user_id=None):
+        """Assigned accounts per officer in scope: {officer_id: (accounts, balance)}"""
+        rows = db.session.query(
+            Account.assigned_officer_id, func.count(Account.id), func.sum(Account.current_balance)
+        ).join(User, Account.assigned_officer_id == User.id).filter(
+            *self._scope_filters(region_id, user_id)
+        ).group_by(Account.assigned_officer_id)
+        return {officer_id: (count, balance or 0) for officer_id, count, balance in rows}
+    
+    def collections(self, start, end, region_id=None):
+        """Completed payments processed in [start, end) per officer: {officer_id: (payments, amount)}.
         
-        # Get accounts data
-        accounts_query = db.session.query(Account).join(User, Account.assigned_officer_id == User.id)
-        if filters:
-            accounts_query = accounts_query.filter(and_(*filters))
-        
-        total_accounts = accounts_query.count()
-        total_balance = accounts_query.with_entities(func.sum(Account.current_balance)).scalar() or 0
-        
-        # Get today's payments
-        payments_today = db.session.query(Payment).filter(
-            func.date(Payment.processed_date) == today,
-            Payment.status == 'completed'
+        Payments on unassigned accounts count under None when no region is given.
+        """
+        query = db.session.query(
+            Account.assigned_officer_id, func.count(Payment.id), func.sum(Payment.amount)
+        ).join(Account, Payment.account_id == Account.id).filter(
+            Payment.status == 'completed',
+            Payment.processed_date >= day_start(start),
+            Payment.processed_date < day_start(end)
         )
         if region_id:
-            payments_today = payments_today.join(Account).join(User, Account.assigned_officer_id == User.id).filter(User.region_id == region_id)
+            query = query.join(User, Account.assigned_officer_id == User.id).filter(User.region_id == region_id)
+        return {officer_id: (count, amount or 0) for officer_id, count, amount in query.group_by(Account.assigned_officer_id)}
+    
+    def promises(self, start, end, region_id=None, user_id=None):
+        """Promises to pay made in [start, end) per officer in scope: {officer_id: count}"""
+        rows = db.session.query(
+            Account.assigned_officer_id, func.count(PromiseToPay.id)
+        ).join(Account, PromiseToPay.account_id == Account.id).join(
+            User, Account.assigned_officer_id == User.id
+        ).filter(
+            PromiseToPay.created_at >= day_start(start),
+            PromiseToPay.created_at < day_start(end),
+            *self._scope_filters(region_id, user_id)
+        ).group_by(Account.assigned_officer_id)
+        return dict(rows.all())
+    
+    def _totals(self, groups):
+        return sum(count for count, _ in groups.values()), sum(total for _, total in groups.values())
+    
+    def generate_daily_report(self, region_id=None, user_id=None, portfolio=None):
+        """Generate daily performance report.
         
-        collections_today = payments_today.count()
-        amount_collected_today = payments_today.with_entities(func.sum(Payment.amount)).scalar() or 0
+        Four grouped queries whatever the number of officers; portfolio may be passed in
+        when the caller already has it for this scope.
+        """
+        today = date.today()
+        tomorrow = today + timedelta(days=1)
+        
+        if portfolio is None:
+            portfolio = self.portfolio(region_id, user_id)
+        collections = self.collections(today, tomorrow, region_id)
+        promises = self.promises(today, tomorrow, region_id, user_id)
+        total_accounts, total_balance = self._totals(portfolio)
+        collections_today, amount_collected_today = self._totals(collections)
         
         # Get officer performance
         officer_performance = []
-        officers_query = db.session.query(User).filter(User.role == 'collections_officer')
-        if filters:
-            officers_query = officers_query.filter(and_(*filters))
-        
-        for officer in officers_query.all():
-            officer_accounts = Account.query.filter_by(assigned_officer_id=officer.id).count()
-            officer_payments = Payment.query.join(Account).filter(
-                Account.assigned_officer_id == officer.id,
-                func.date(Payment.processed_date) == today,
-                Payment.status == 'completed'
-            )
-            officer_collections = officer_payments.count()
-            officer_amount = officer_payments.with_entities(func.sum(Payment.amount)).scalar() or 0
-            officer_ptps = PromiseToPay.query.join(Account).filter(
-                Account.assigned_officer_id == officer.id,
-                func.date(PromiseToPay.created_at) == today
-            ).count()
-            
+        officers = db.session.query(User.id, User.username).filter(
+            User.role == 'collections_officer', *self._scope_filters(region_id, user_id)
+        )
+        for officer_id, username in officers:
+            officer_collections, officer_amount = collections.get(officer_id, (0, 0))
             officer_performance.append({
-                'name': f"{officer.username}",
-                'accounts': officer_accounts,
+                'name': f"{username}",
+                'accounts': portfolio.get(officer_id, (0, 0))[0],
                 'collections': officer_collections,
                 'amount': float(officer_amount),
-                'ptps': officer_ptps
+                'ptps': promises.get(officer_id, 0)
             })
         
         return {
@@ -77,83 +110,96 @@ class ReportGenerator:
             'report_date': today.isoformat()
         }
     
-    def generate_weekly_report(self, region_id=None, user_id=None):
-        """Generate weekly performance report"""
+    def generate_weekly_report(self, region_id=None, user_id=None, portfolio=None):
+        """Generate weekly performance report (Monday through today)"""
         today = date.today()
         week_start = today - timedelta(days=today.weekday())
         
-        # Similar to daily but for week range
-        filters = []
-        if region_id:
-            filters.append(User.region_id == region_id)
-        if user_id:
-            filters.append(User.id == user_id)
-        
-        # Get week's payments
-        payments_week = db.session.query(Payment).filter(
-            Payment.processed_date >= week_start,
-            Payment.processed_date <= today,
-            Payment.status == 'completed'
+        if portfolio is None:
+            portfolio = self.portfolio(region_id, user_id)
+        total_accounts, total_balance = self._totals(portfolio)
+        collections_week, amount_collected_week = self._totals(
+            self.collections(week_start, today + timedelta(days=1), region_id)
         )
-        if region_id:
-            payments_week = payments_week.join(Account).join(User, Account.assigned_officer_id == User.id).filter(User.region_id == region_id)
-        
-        collections_week = payments_week.count()
-        amount_collected_week = payments_week.with_entities(func.sum(Payment.amount)).scalar() or 0
         
         return {
-            'total_accounts': self.generate_daily_report(region_id, user_id)['total_accounts'],
-            'total_balance': self.generate_daily_report(region_id, user_id)['total_balance'],
+            'total_accounts': total_accounts,
+            'total_balance': float(total_balance),
             'collections_week': collections_week,
             'amount_collected_week': float(amount_collected_week),
             'week_start': week_start.isoformat(),
             'week_end': today.isoformat()
         }
     
-    def execute_scheduled_reports(self):
-        """Execute all scheduled reports"""
+    def report_spec(self, template, today):
+        """The dataset a template reports on today, as (report_type, region_id), or None if not due"""
+        config = json.loads(template.template_config or '{}')
+        if template.report_type == 'daily' or (template.report_type == 'weekly' and today.weekday() == 0):  # Monday
+            return template.report_type, config.get('region_id') or None
+        return None
+    
+    def _generate_region(self, app, region_id, report_types):
+        """Build every report type due for one region on a worker thread, sharing its portfolio query"""
+        with app.app_context():
+            portfolio = self.portfolio(region_id)
+            generators = {'daily': self.generate_daily_report, 'weekly': self.generate_weekly_report}
+            return {
+                (report_type, region_id): json.dumps(generators[report_type](region_id, portfolio=portfolio))
+                for report_type in report_types
+            }
+    
+    def execute_scheduled_reports(self, workers=None):
+        """Execute all scheduled reports; returns {'reports': generated, 'emails': queued}.
+        
+        Templates are grouped by the dataset they report on, each distinct dataset is built
+        once (regions in parallel) and the result fans out to every matching template.
+        """
         today = date.today()
+        stats = {'reports': 0, 'emails': 0}
+        
+        # Active templates not yet run today, by the dataset each needs
+        done = {template_id for template_id, in db.session.query(ReportExecution.template_id).filter_by(report_date=today)}
+        templates_by_spec = {}
+        for template in ReportTemplate.query.filter_by(active=True).all():
+            spec = self.report_spec(template, today) if template.id not in done else None
+            if spec:
+                templates_by_spec.setdefault(spec, []).append(template)
+        if not templates_by_spec:
+            return stats
         
-        # Get all active report templates
-        templates = ReportTemplate.query.filter_by(active=True).all()
+        regions = {}
+        for report_type, region_id in templates_by_spec:
+            regions.setdefault(region_id, []).append(report_type)
+        app = current_app._get_current_object()
+        report_data = {}
+        with ThreadPoolExecutor(max_workers=min(workers or REPORT_WORKERS, len(regions))) as pool:
+            for datasets in pool.map(lambda item: self._generate_region(app, *item), regions.items()):
+                report_data.update(datasets)
         
-        for template in templates:
-            # Check if report already generated today
-            existing = ReportExecution.query.filter_by(
-                template_id=template.id,
-                report_date=today
-            ).first()
-            
-            if existing:
-                continue
-            
-            # Generate report based on type
-            config = json.loads(template.template_config)
-            region_id = config.get('region_id')
-            
-            if template.report_type == 'daily':
-                report_data = self.generate_daily_report(region_id)
-            elif template.report_type == 'weekly' and today.weekday() == 0:  # Monday
-                report_data = self.generate_weekly_report(region_id)
-            else:
-                continue
-            
-            # Create report execution record
-            execution = ReportExecution(
-                id=str(uuid.uuid4()),
-                template_id=template.id,
-                report_date=today,
-                status='completed',
-                report_data=json.dumps(report_data),
-                completed_at=datetime.utcnow()
-            )
-            db.session.add(execution)
-            db.session.commit()
-            
-            # Send emails
-            email_service.send_report_email(execution.id)
+        # Create report execution records
+        executions = []
+        for spec, templates in templates_by_spec.items():
+            for template in templates:
+                execution = ReportExecution(
+                    id=str(uuid.uuid4()),
+                    template_id=template.id,
+                    report_date=today,
+                    status='completed',
+                    report_data=report_data[spec],
+                    completed_at=datetime.utcnow()
+                )
+                db.session.add(execution)
+                executions.append(execution)
+        db.session.commit()
+        
+        # Send emails
+        for execution in executions:
+            stats['emails'] += email_service.send_report_email(execution.id) or 0
+            stats['reports'] += 1
             execution.email_sent = True
-            db.session.commit()
+        db.session.commit()
+        
+        return stats
     
     def create_report_template(self, name, report_type, recipients, config, created_by):
         """Create a new report template"""
@@ -6,6 +6,8 @@ Creates comprehensive test data for Collections Management System
 
 from app import app, db
 from models import *
+from password_hashing import hash_passwords
+from alert_service import alert_service
 import uuid
 from datetime import datetime, date, timedelta
 import random
@@ -71,10 +73,9 @@ def seed_comprehensive_data():
         ]
         
         users = []
-        for u in users_data:
-            pwd = u.pop('password')
-            user = User(id=str(uuid.uuid4()), **u, active=True)
-            user.set_password(pwd)
+        password_hashes = hash_passwords(u.pop('password') for u in users_data)
+        for u, password_hash in zip(users_data, password_hashes):
+            user = User(id=str(uuid.uuid4()), **u, password_hash=password_hash, active=True)
             users.append(user)
             db.session.add(user)
         
@@ -194,13 +195,15 @@ def seed_comprehensive_data():
                         payment_method=random.choice(['mpesa', 'bank_transfer', 'cash', 'cheque']),
                         status='completed',
                         processed_date=datetime.now() - timedelta(days=random.randint(0, 365)),
-                        reference_number=f"REF{random.randint(100000,999999)}",
+                        reference_number=f"REF{payment_count + 1:06d}",  # Unique, like statement references
                         created_by=account.assigned_officer_id,
                         created_at=datetime.now() - timedelta(days=random.randint(0, 365))
                     )
                     db.session.add(payment)
                     payment_count += 1
         
+        db.session.commit()
+        Account.refresh_payment_rollups()
         db.session.commit()
         print(f"✅ Created {payment_count} payments")
         
@@ -466,6 +469,8 @@ def seed_comprehensive_data():
             db.session.add(alert)
             alert_count += 1
         
+        db.session.commit()
+        alert_service.rebuild_alert_counters()  # Seeded alerts bypass insert_alerts, so count them here
         db.session.commit()
         print(f"✅ Created {alert_count} alerts")
         
@@ -0,0 +1,145 @@
+import time
+import queue
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POOL_SIZE = 4  # Concurrent SMTP connections (and sending threads)
+DOMAIN_RATE_LIMIT = 300  # Messages per minute to any one recipient domain
+DOMAIN_RATE_LIMITS = {}  # Per-domain overrides, e.g. {'gmail.com': 120}
+IDLE_CHECK_SECONDS = 30  # Connections idle longer than this are probed with NOOP before reuse
+
+
+class DomainRateLimiter:
+    """Token bucket per recipient domain, shared by all sending threads"""
+
+    def __init__(self, per_minute=DOMAIN_RATE_LIMIT, overrides=None):
+        self.per_minute = per_minute
+        self.overrides = dict(DOMAIN_RATE_LIMITS if overrides is None else overrides)
+        self.buckets = {}  # domain -> [tokens, last refill]
+        self.lock = threading.Lock()
+
+    def rate(self, domain):
+        return self.overrides.get(domain, self.per_minute)
+
+    def acquire(self, domain):
+        """Block until a message to domain may be sent"""
+        rate = self.rate(domain)
+        if not rate:
+            return
+        per_second = rate / 60.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                tokens, last = self.buckets.get(domain, (1.0, now))
+                tokens = min(1.0 + per_second, tokens + (now - last) * per_second)  # Small burst allowance
+                if tokens >= 1:
+                    self.buckets[domain] = (tokens - 1, now)
+                    return
+                self.buckets[domain] = (tokens, now)
+                wait = (1 - tokens) / per_second
+            time.sleep(wait)
+
+
+class SMTPConnectionPool:
+    """Bounded pool of persistent, logged-in connections opened through EmailService.connect()"""
+
+    def __init__(self, email_service, size=POOL_SIZE):
+        self.email_service = email_service
+        self.size = size
+        self.idle = queue.LifoQueue()  # (connection, last used); most recent first keeps few connections warm
+        self.slots = threading.BoundedSemaphore(size)
+
+    def _healthy(self, connection, last_used):
+        if connection is None or time.monotonic() - last_used < IDLE_CHECK_SECONDS:
+            return True
+        try:
+            return connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def acquire(self):
+        """Check out a connection, reusing an idle one when it still works"""
+        self.slots.acquire()
+        try:
+            while True:
+                try:
+                    connection, last_used = self.idle.get_nowait()
+                except queue.Empty:
+                    return self.email_service.connect()
+                if self._healthy(connection, last_used):
+                    return connection
+                self.email_service.disconnect(connection)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, connection, broken=False):
+        if broken:
+            self.email_service.disconnect(connection)
+        else:
+            self.idle.put((connection, time.monotonic()))
+        self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                connection, _ = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            self.email_service.disconnect(connection)
+
+
+class PooledSMTPSender:
+    """Sends messages concurrently over a pool of persistent SMTP connections.
+
+    Each message waits for its recipient domain's rate limit, takes a pooled connection and
+    is sent with EmailService.deliver_message. A dropped connection is replaced and the
+    message retried once; if the server cannot be reached at all, the rest of the call
+    fails fast instead of waiting out a connect timeout per message.
+    """
+
+    def __init__(self, email_service, pool_size=POOL_SIZE, rate_limiter=None):
+        self.email_service = email_service
+        self.pool = SMTPConnectionPool(email_service, pool_size)
+        self.rate_limiter = rate_limiter or DomainRateLimiter()
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='smtp')
+        self.available = True
+
+    def _send(self, to_email, subject, body):
+        if not self.available:
+            raise smtplib.SMTPConnectError(421, 'SMTP server unavailable')
+        self.rate_limiter.acquire(to_email.rpartition('@')[2].lower())
+        for attempt in range(2):
+            try:
+                connection = self.pool.acquire()
+            except (smtplib.SMTPException, OSError):
+                self.available = False
+                raise
+            try:
+                self.email_service.deliver_message(connection, to_email, subject, body)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+                # Rejected message; the connection is fine for the next one
+                self.pool.release(connection)
+                raise
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError):
+                self.pool.release(connection, broken=True)
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self.pool.release(connection, broken=True)
+                raise
+            self.pool.release(connection)
+            return
+
+    def send_many(self, messages):
+        """Send [(key, to_email, subject, body)] concurrently; returns {key: None if sent, else the exception}"""
+        self.available = True
+        futures = {key: self.executor.submit(self._send, to_email, subject, body)
+                   for key, to_email, subject, body in messages}
+        return {key: future.exception() for key, future in futures.items()}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.close()
@@ -0,0 +1,67 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+import sqlalchemy as sa
+from flask_jwt_extended import create_access_token
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app  # noqa: E402
+from models import db, Region, User, Consumer, Creditor, Account  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """The app bound to a fresh SQLite database per test"""
+    engine = sa.create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    engines = db._app_engines[flask_app]
+    original = dict(engines)
+    engines.clear()
+    engines[None] = engine
+    flask_app.config.update(TESTING=True, IMPORT_SPOOL_DIR=str(tmp_path / 'imports'))
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+    engines.clear()
+    engines.update(original)
+    engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def seed(app):
+    """Two regions with a manager and officers, and accounts assigned across them"""
+    db.session.add_all([
+        Region(id='r1', name='Region 1', code='R1'),
+        Region(id='r2', name='Region 2', code='R2'),
+    ])
+    for user_id, role, region_id in [
+        ('admin', 'administrator', None),
+        ('manager', 'collections_manager', 'r1'),
+        ('officer1', 'collections_officer', 'r1'),
+        ('officer2', 'collections_officer', 'r1'),
+        ('officer3', 'collections_officer', 'r2'),
+    ]:
+        user = User(id=user_id, username=user_id, email=f'{user_id}@example.com', role=role, region_id=region_id)
+        user.password_hash = 'x'
+        db.session.add(user)
+    db.session.add(Consumer(id='consumer', first_name='Jane', last_name='Doe', region_id='r1'))
+    db.session.add(Creditor(id='creditor', short_name='BANK', full_name='Bank'))
+    for i, officer_id in enumerate(['officer1'] * 3 + ['officer2'] * 2 + ['officer3'] * 2):
+        db.session.add(Account(
+            id=f'acct{i}', consumer_id='consumer', creditor_id='creditor', account_number=f'N{i}',
+            original_balance=1000, current_balance=1000 - i, placement_date=date.today() - timedelta(days=90),
+            assigned_officer_id=officer_id
+        ))
+    db.session.commit()
+
+
+def auth(user_id):
+    return {'Authorization': 'Bearer ' + create_access_token(identity=user_id)}
@@ -0,0 +1,35 @@
+import threading
+
+from alert_service import AlertService
+
+
+def test_concurrent_check_runs_keep_their_own_state(app, seed):
+    """Two runs on one instance (e.g. 'Alert checks' and 'Full alert rescan') must not share digests or watermarks"""
+    service = AlertService(digest=True)
+    both_running = threading.Barrier(2, timeout=10)
+    seen, stats = {}, {}
+
+    def run_checks():
+        name = threading.current_thread().name
+        service.pending_digests[f'{name}@example.com'] = []
+        both_running.wait()
+        seen[name] = (set(service.pending_digests), service.watermarks is not None)
+        both_running.wait()
+        return {'payment_due': 0, 'payment_overdue': 0, 'high_priority': 0}
+
+    service._run_checks = run_checks
+
+    def run(name, full_scan):
+        with app.app_context():
+            stats[name] = service.run_daily_checks(full_scan=full_scan)
+
+    threads = [threading.Thread(target=run, name=name, args=(name, name == 'rescan')) for name in ('checks', 'rescan')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert seen == {'checks': ({'checks@example.com'}, True), 'rescan': ({'rescan@example.com'}, True)}
+    assert stats['checks']['digestRecipients'] == stats['rescan']['digestRecipients'] == 1
+    assert stats['rescan']['fullScan']
+    assert service.directory is None and service.pending_digests is None
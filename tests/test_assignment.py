@@ -0,0 +1,37 @@
+from models import Account
+from conftest import auth
+
+
+def bulk_assign(client, payload, user='manager'):
+    return client.post('/api/accounts/bulk-assign', json=payload, headers=auth(user))
+
+
+def officers():
+    return {account.id: account.assigned_officer_id for account in Account.query.order_by(Account.id)}
+
+
+def test_bulk_assign_by_filter_moves_only_matching_accounts(client, seed):
+    response = bulk_assign(client, {'officerId': 'officer2', 'filter': {'officerId': 'officer1'}})
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['reassigned'] == 3
+    assert list(officers().values()).count('officer2') == 5
+
+
+def test_bulk_assign_rejects_unknown_filter_keys(client, seed):
+    before = officers()
+
+    response = bulk_assign(client, {'officerId': 'officer2', 'filter': {'officer_id': 'officer1'}})
+
+    assert response.status_code == 400
+    assert 'officer_id' in response.get_json()['error']['message']
+    assert officers() == before
+
+
+def test_bulk_assign_rejects_filter_without_criteria(client, seed):
+    before = officers()
+
+    response = bulk_assign(client, {'officerId': 'officer2', 'filter': {'status': '', 'unassigned': False}})
+
+    assert response.status_code == 400
+    assert officers() == before
@@ -0,0 +1,34 @@
+import json
+import uuid
+from datetime import date
+
+from email_service import email_service
+from models import db, EmailNotification, ReportExecution, ReportTemplate
+from report_generator import report_generator
+
+
+def test_send_report_email_queues_one_notification_per_recipient(seed):
+    template = ReportTemplate(
+        id=str(uuid.uuid4()), name='Daily Collections', report_type='daily',
+        recipients=json.dumps(['admin', 'manager', 'missing']), template_config='{}', created_by='admin'
+    )
+    execution = ReportExecution(
+        id=str(uuid.uuid4()), template=template, report_date=date.today(), status='completed',
+        report_data=json.dumps(report_generator.generate_daily_report())
+    )
+    db.session.add_all([template, execution])
+    db.session.commit()
+
+    assert email_service.send_report_email(execution.id) == 2
+
+    notifications = EmailNotification.query.filter_by(report_execution_id=execution.id).all()
+    assert sorted(n.recipient_email for n in notifications) == ['admin@example.com', 'manager@example.com']
+    assert all(n.status == 'pending' and n.subject.startswith('Daily Collections') for n in notifications)
+
+
+def test_scheduled_reports_email_every_template(seed):
+    report_generator.create_report_template('Daily', 'daily', ['admin'], {}, 'admin')
+    report_generator.create_report_template('Daily R1', 'daily', ['manager'], {'region_id': 'r1'}, 'admin')
+
+    assert report_generator.execute_scheduled_reports() == {'reports': 2, 'emails': 2}
+    assert ReportExecution.query.filter_by(email_sent=True).count() == 2
@@ -0,0 +1,76 @@
+import functools
+import io
+
+import import_service
+from models import db, BatchJob, Payment
+from conftest import auth
+
+STATEMENT = (
+    'account_id,amount,method,reference,paid_at\n'
+    'acct0,100,mpesa,REF1,2026-10-01 10:00:00\n'
+    'acct1,50,bank,REF2,10/02/2026 14:30\n'
+    'acct2,25,cash,REF3,2026-10-03\n'
+    'acct3,10,mpesa,REF4,2026-10-04T08:15:00\n'
+    'acct4,5,mpesa,REF5,2026-10-05\n'
+)
+
+
+def import_statement(client, body=STATEMENT):
+    response = client.post(
+        '/api/payments/import?wait=true', headers=auth('admin'), content_type='multipart/form-data',
+        data={'file': (io.BytesIO(body.encode()), 'statement.csv')}
+    )
+    data = response.get_json()['data']
+    return data, db.session.get(BatchJob, data['jobId'])
+
+
+def counters(job):
+    db.session.refresh(job)
+    return job.total_records, job.processed_records, job.success_records, job.failed_records
+
+
+def test_payment_import_keeps_statement_times(client, seed):
+    data, job = import_statement(client)
+
+    assert (data['imported'], data['failed'], data['skipped']) == (5, 0, 0)
+    assert counters(job) == (5, 5, 5, 0)
+    assert str(Payment.query.filter_by(reference_number='REF1').one().processed_date) == '2026-10-01 10:00:00'
+
+
+def test_resent_statement_counts_duplicates_as_processed(client, seed):
+    import_statement(client)
+
+    data, job = import_statement(client)
+
+    assert (data['imported'], data['failed'], data['skipped']) == (0, 0, 5)
+    assert data['counts'] == {'inserted': 0, 'duplicates': 5}
+    assert counters(job) == (5, 5, 0, 0)
+    assert Payment.query.count() == 5
+
+
+def test_resumed_import_totals_match_the_file(client, seed, monkeypatch):
+    import_statement(client)
+    original = import_service.BaseImporter.process_chunk
+    calls = []
+
+    def crash_second_chunk(self, chunk, result):
+        calls.append(chunk)
+        if len(calls) == 2:
+            raise RuntimeError('worker killed')
+        return original(self, chunk, result)
+
+    monkeypatch.setitem(import_service.IMPORTERS, 'payment_import',
+                        functools.partial(import_service.PaymentImporter, chunk_size=2))
+    monkeypatch.setattr(import_service.BaseImporter, 'process_chunk', crash_second_chunk)
+    # REF1-REF5 are on file already, REF1 also repeats within the file; REF6 and REF7 are new
+    body = STATEMENT + 'acct5,7,mpesa,REF6,2026-10-06\nacct6,8,mpesa,REF1,2026-10-07\nacct6,9,mpesa,REF7,2026-10-08\n'
+    _, job = import_statement(client, body)
+    assert job.status == 'failed'
+    assert counters(job) == (8, 2, 0, 0)
+
+    monkeypatch.setattr(import_service.BaseImporter, 'process_chunk', original)
+    result = import_service.import_service.process_job(job.id)
+
+    assert (result['imported'], result['skipped']) == (2, 6)
+    assert job.status == 'completed' and job.error_log == '[]'
+    assert counters(job) == (8, 8, 2, 0)
@@ -0,0 +1,40 @@
+import json
+
+from models import LegalCase
+from conftest import auth
+
+UPLOAD = '/api/analytics/legal-cases/upload'
+
+
+def upload_json(client, cases):
+    return client.post(UPLOAD, json={'cases': cases}, headers=auth('manager')).get_json()
+
+
+def upload_ndjson(client, cases):
+    body = '\n'.join(json.dumps(case) for case in cases)
+    return client.post(UPLOAD, data=body, headers=dict(auth('manager'), **{'Content-Type': 'application/x-ndjson'})).get_json()
+
+
+def test_json_upload_updates_resent_cases(client, seed):
+    case = {'caseNumber': 'HC-1', 'accountId': 'acct0', 'recoveryAmount': 360557, 'filedDate': '2026-01-02',
+            'assignedFirm': 'Firm & Co', 'notes': 'filed'}
+    assert upload_json(client, [case])['data']['counts'] == {'inserted': 1, 'updated': 0}
+
+    response = upload_json(client, [dict(case, status='in_progress'), {'caseNumber': 'HC-2', 'accountId': 'missing'}])
+
+    assert response['success']
+    assert response['data']['counts'] == {'inserted': 0, 'updated': 1}
+    assert response['data']['errors'] == ["Case 2: Account 'missing' not found"]
+    stored = LegalCase.query.filter_by(case_number='HC-1').one()
+    assert stored.status == 'in_progress' and float(stored.recovery_amount) == 360557
+
+
+def test_partial_ndjson_update_keeps_other_fields(client, seed):
+    upload_ndjson(client, [{'caseNumber': 'HC-1', 'accountId': 'acct0', 'recoveryAmount': 360557,
+                            'filedDate': '2026-01-02', 'assignedFirm': 'Firm & Co', 'notes': 'filed'}])
+
+    upload_ndjson(client, [{'caseNumber': 'HC-1', 'accountId': 'acct0', 'status': 'won'}])
+
+    stored = LegalCase.query.filter_by(case_number='HC-1').one()
+    assert (stored.status, float(stored.recovery_amount), str(stored.filed_date), stored.assigned_firm, stored.notes) == \
+        ('won', 360557, '2026-01-02', 'Firm & Co', 'filed')